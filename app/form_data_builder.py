@@ -22,8 +22,8 @@ class FormUseCaseType(Enum):
 # 2. DEFINE THE "BLUEPRINT" FOR EACH PRODUCT
 # ===================================================================
 # This structure defines the unique assembly line for each dossier type.
-class FormTemplate(TypedDict):
-    """A blueprint for a specific recruitment dossier."""
+class FormTemplateSpec(TypedDict):
+    """A blueprint for a specific recruitment dossier, as written by hand."""
     name: str
     description: str
     # The ordered sequence of step IDs required for this specific dossier.
@@ -34,6 +34,33 @@ class FormTemplate(TypedDict):
     pdf_template_path: str | Path  # Path to the specific PDF template file
     dataframe_page_map: dict[str, int]  # Maps dataframe keys to page numbers
 
+class FormTemplate(FormTemplateSpec):
+    """A registered blueprint: the spec plus its navigation maps."""
+    # Precomputed from step_sequence by with_step_navigation(): step ID ->
+    # the step ID to move to. Step 0 (the dossier selector) is included.
+    next_step_map: dict[int, int]
+    prev_step_map: dict[int, int]
+
+def build_step_navigation(step_sequence: list[int]) -> tuple[dict[int, int], dict[int, int]]:
+    """
+    Turns a step sequence into (next_step_map, prev_step_map) so navigation
+    is a single dict lookup. Step IDs missing from the maps fall back to 0.
+    """
+    if not step_sequence:
+        return {}, {}
+    next_map: dict[int, int] = {0: step_sequence[0]}
+    prev_map: dict[int, int] = {step_sequence[0]: 0}
+    for previous_id, step_id in zip(step_sequence, step_sequence[1:]):
+        next_map[previous_id] = step_id
+        prev_map[step_id] = previous_id
+    next_map[step_sequence[-1]] = step_sequence[-1] # Stay on the last step
+    return next_map, prev_map
+
+def with_step_navigation(spec: FormTemplateSpec) -> FormTemplate:
+    """Returns a new FormTemplate with the spec's navigation maps; the spec is left untouched."""
+    next_step_map, prev_step_map = build_step_navigation(spec['step_sequence'])
+    return FormTemplate(**spec, next_step_map=next_step_map, prev_step_map=prev_step_map)
+
 # ===================================================================
 # 3. BUILD THE "FACTORY" - THE REGISTRY OF ALL BLUEPRINTS
 # ===================================================================
@@ -41,7 +68,7 @@ class FormTemplate(TypedDict):
 # to its specific blueprint. The step_ids are derived directly from the
 # legal analysis in your PDF.
 
-FORM_TEMPLATE_REGISTRY: dict[FormUseCaseType, FormTemplate] = {
+_FORM_TEMPLATE_SPECS: dict[FormUseCaseType, FormTemplateSpec] = {
     FormUseCaseType.PRIVATE_SECTOR: {
         'name': "Hồ sơ Doanh nghiệp Tư nhân",
         'description':  "Một CV/resume hiện đại, linh hoạt, tập trung vào kỹ năng và kinh nghiệm. Không theo mẫu nhà nước.",
@@ -59,3 +86,8 @@ FORM_TEMPLATE_REGISTRY: dict[FormUseCaseType, FormTemplate] = {
         }
     },
 }
+
+# Navigation maps are built here, once, so reading them never mutates anything.
+FORM_TEMPLATE_REGISTRY: dict[FormUseCaseType, FormTemplate] = {
+    use_case: with_step_navigation(spec) for use_case, spec in _FORM_TEMPLATE_SPECS.items()
+}
@@ -3,28 +3,31 @@
 # ===================================================================
 import sqlite3
 import json
+import asyncio
+import threading
 import base64
 import os
 import logging
 from pathlib import Path
 from passlib.context import CryptContext
-import calendar
-from nicegui import ui, app
+from nicegui import ui, app, run
 from typing import Any, cast
-from collections.abc import Callable
-import fitz
-import tempfile
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from functools import lru_cache, partial
 from datetime import datetime, date
 
 # Local application imports
-from .validation import ValidatorFunc, EMAIL_PATTERN
-from .form_data_builder import FormUseCaseType, FormTemplate, FORM_TEMPLATE_REGISTRY
+from .validation import is_email
+from .form_data_builder import (
+    PROJECT_ROOT, FormUseCaseType, FormTemplate, FORM_TEMPLATE_REGISTRY
+)
 from .utils import (
-    AppSchema, FormField, STEP_KEY, SELECTED_USE_CASE_KEY,
-    FORM_ATTEMPTED_SUBMISSION_KEY, CURRENT_STEP_ERRORS_KEY,
-    DataframeConfig, StepDefinition, DataframeColumnRules
+    AppSchema, FormField, PDFColumn, STEP_KEY, SELECTED_USE_CASE_KEY,
+    FORM_ATTEMPTED_SUBMISSION_KEY, CURRENT_STEP_ERRORS_KEY, DIRTY_FIELDS_KEY, FORM_DATA_VERSION_KEY, DEFAULT_FIELD_VALUES,
+    DataframeConfig, StepDefinition, DataframeColumnRuleItems, ValidatorChain, StepValidationPlan
 )
-from .step_definitions import STEPS_BY_ID
+from .step_definitions import STEPS_BY_ID, VALIDATION_PLAN_BY_STEP_ID
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -39,9 +42,26 @@ DATA_DIR: Path = Path(os.environ.get('RENDER_DISK_PATH', '.'))
 DB_PATH: Path = DATA_DIR / "autoly.db"
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Hot-path statements. Passing the identical string each time lets every
+# connection's statement cache skip the parse/plan step.
+INSERT_USER_SQL: str = "INSERT INTO users (username, hashed_password, form_data) VALUES (?, ?, ?)"
+SELECT_LOGIN_SQL: str = "SELECT hashed_password, form_data FROM users WHERE username = ? LIMIT 1"
+UPDATE_FORM_DATA_SQL: str = "UPDATE users SET form_data = ? WHERE username = ?"
+
+# One connection per thread (the event loop plus run.io_bound workers), opened
+# lazily and reused. `with conn:` only commits or rolls back, it never closes.
+_thread_local = threading.local()
+
 def get_db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    conn: sqlite3.Connection | None = getattr(_thread_local, 'conn', None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=128)
+    # Per-connection settings; WAL itself is persisted in the file by setup_database().
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-20000;")
+    _thread_local.conn = conn
     return conn
 
 def setup_database() -> None:
@@ -50,6 +70,8 @@ def setup_database() -> None:
         if not DATA_DIR.exists():
             DATA_DIR.mkdir(parents=True, exist_ok=True)
         with get_db_connection() as conn:
+            # WAL lets logins read while a save is writing and skips most fsyncs.
+            conn.execute("PRAGMA journal_mode=WAL;")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,52 +99,181 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_current_user() -> str | None:
     """Safely retrieves the username from the user's session storage."""
-    # Ensure app.storage.user is treated as a dict
-    user_storage = cast(dict[str, Any], app.storage.user)
-    return cast(str | None, user_storage.get('username'))
+    # Annotated rather than cast(): same typing, no runtime call.
+    user_storage: dict[str, Any] = app.storage.user
+    return user_storage.get('username')
 
 def get_form_data() -> dict[str, Any]:
     """
     Retrieves the user's form data from the IN-MEMORY session storage.
     This is the single source of truth for the UI.
     """
-    user_storage = cast(dict[str, Any], app.storage.user)
+    user_storage: dict[str, Any] = app.storage.user
     # This now reads from the live session, not the DB.
-    form_data = user_storage.get('form_data')
+    form_data: dict[str, Any] | None = user_storage.get('form_data')
     if form_data is None:
         # This is a fallback, but in a proper flow, 'form_data' should always exist.
         logger.warning("form_data was missing from app.storage.user. Returning empty dict.")
         return {}
-    return cast(dict[str, Any], form_data)
+    return form_data
+
+_SESSION_ONLY_KEYS: frozenset[str] = frozenset({DIRTY_FIELDS_KEY, FORM_DATA_VERSION_KEY})
+
+def dump_form_data(form_data: dict[str, Any]) -> str:
+    """Compact JSON for the form_data column; Vietnamese text is stored as-is, not \\u-escaped."""
+    if DIRTY_FIELDS_KEY in form_data or FORM_DATA_VERSION_KEY in form_data:
+        # Edit tracking and the change counter are per-session bookkeeping:
+        # a persisted dirty map could pin a stale error across a deploy that
+        # changes a validator.
+        form_data = {key: value for key, value in form_data.items() if key not in _SESSION_ONLY_KEYS}
+    return json.dumps(form_data, separators=(',', ':'), ensure_ascii=False)
+
+# --- Debounced persistence ---
+# Saves only mark the user's live form_data as dirty; one background task
+# writes every dirty user in a single transaction after a short delay, so a
+# burst of step transitions costs one UPDATE per user instead of one each.
+FORM_DATA_FLUSH_DELAY_SECONDS: float = 2.0
+# Failed writes are retried with a doubling delay, up to this cap.
+FORM_DATA_MAX_RETRY_DELAY_SECONDS: float = 300.0
+_PENDING_FORM_DATA: dict[str, dict[str, Any]] = {}
+# The snapshot the running flush is writing; it is in neither the queue nor
+# the database until that write returns.
+_IN_FLIGHT_FORM_DATA: dict[str, dict[str, Any]] = {}
+_flush_lock = asyncio.Lock() # One flush at a time; awaiting it waits out the one in flight.
+_write_lock = threading.Lock() # Orders a worker-thread write before the shutdown write.
+_flush_task: asyncio.Task[None] | None = None
+_flush_failures: int = 0
+
+def _write_form_data_rows(rows: list[tuple[str, str]]) -> bool:
+    """
+    One transaction for every pending (json, username) row. Returns True so
+    callers can tell a real write from run.io_bound's None for a skipped call.
+    """
+    with _write_lock, get_db_connection() as conn:
+        conn.executemany(UPDATE_FORM_DATA_SQL, rows)
+    return True
+
+def _serialize_rows(pending: dict[str, dict[str, Any]]) -> list[tuple[str, str]]:
+    # Serialize on the event loop so the snapshot can't race a UI handler.
+    return [(dump_form_data(form_data), username) for username, form_data in pending.items()]
+
+def _requeue_pending(pending: dict[str, dict[str, Any]]) -> None:
+    """Puts an unwritten snapshot back, unless a user was re-queued meanwhile."""
+    for username, form_data in pending.items():
+        _PENDING_FORM_DATA.setdefault(username, form_data)
+
+async def flush_pending_form_data() -> None:
+    """
+    Writes every pending form_data to the database now. If another flush is
+    in flight, waits for it first, so on return nothing saved earlier is
+    still on its way to the database.
+    """
+    global _flush_failures
+    async with _flush_lock:
+        if not _PENDING_FORM_DATA:
+            return
+        pending = dict(_PENDING_FORM_DATA)
+        _PENDING_FORM_DATA.clear()
+        _IN_FLIGHT_FORM_DATA.update(pending)
+        rows = _serialize_rows(pending)
+        try:
+            written = await run.io_bound(_write_form_data_rows, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save form_data to DB for {list(pending)}: {e}")
+            written = False
+        except asyncio.CancelledError:
+            _requeue_pending(pending)
+            raise
+        finally:
+            _IN_FLIGHT_FORM_DATA.clear()
+        if not written:
+            # Nothing reached the database (error, or io_bound skipped the call
+            # because the app is stopping): keep it queued and retry later.
+            _requeue_pending(pending)
+            _flush_failures += 1
+            _schedule_flush(min(FORM_DATA_FLUSH_DELAY_SECONDS * 2 ** _flush_failures, FORM_DATA_MAX_RETRY_DELAY_SECONDS))
+            return
+        _flush_failures = 0
+        logger.info(f"Successfully saved form data to DB for {len(rows)} user(s).")
+
+def _flush_pending_form_data_on_shutdown() -> None:
+    """
+    Shutdown hook. run.io_bound no longer runs anything once the app is
+    stopping, so the final write happens right here on the calling thread.
+    It also covers a flush still in flight: _write_lock lets that write
+    finish first, and queued data replaces it where both exist.
+    """
+    pending = {**_IN_FLIGHT_FORM_DATA, **_PENDING_FORM_DATA}
+    if not pending:
+        return
+    _PENDING_FORM_DATA.clear()
+    rows = _serialize_rows(pending)
+    try:
+        _write_form_data_rows(rows)
+        logger.info(f"Saved form data to DB for {len(rows)} user(s) on shutdown.")
+    except sqlite3.Error as e:
+        logger.error(f"Failed to save form_data to DB on shutdown for {list(pending)}: {e}")
+        _requeue_pending(pending)
+
+async def _flush_after_delay(delay: float) -> None:
+    global _flush_task
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        _flush_task = None
+    await flush_pending_form_data()
+
+def _schedule_flush(delay: float) -> None:
+    """Starts the delayed flush unless one is already waiting."""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_after_delay(delay))
 
 def save_form_data_to_db() -> None:
     """
-    Serializes the user's CURRENT IN-MEMORY form data to JSON 
-    and saves it to the database. Call this function only when you need to persist.
+    Queues the user's CURRENT IN-MEMORY form data to be saved to the database.
+    The write happens in the background shortly after; call
+    flush_pending_form_data() when it must land immediately (e.g. logout).
     """
     username = get_current_user()
     if not username:
         raise PermissionError("User not authenticated.")
 
     # Get the data from the single source of truth: app.storage.user
-    form_data = get_form_data()
+    _PENDING_FORM_DATA[username] = get_form_data()
+    _schedule_flush(FORM_DATA_FLUSH_DELAY_SECONDS)
 
-    try:
-        form_data_json = json.dumps(form_data)
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET form_data = ? WHERE username = ?", (form_data_json, username))
-            conn.commit()
-            logger.info(f"Successfully saved form data to DB for user '{username}'.")
-    except sqlite3.Error as e:
-        logger.error(f"Failed to save form_data to DB for user '{username}': {e}")
+async def load_login_row(username: str) -> tuple[str, str | None] | None:
+    """
+    Returns the user's (hashed_password, form_data_json), or None if there is
+    no such user. Changes still queued or being written for the user (e.g.
+    from a session in another tab) are flushed first, and win if that write
+    did not happen.
+    """
+    if username in _PENDING_FORM_DATA or username in _IN_FLIGHT_FORM_DATA:
+        await flush_pending_form_data()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Fetch password AND the form data at the same time
+        cursor.execute(SELECT_LOGIN_SQL, (username,))
+        row: tuple[str, str | None] | None = cursor.fetchone()
+    if row is None:
+        return None
+    still_pending = _PENDING_FORM_DATA.get(username)
+    if still_pending is not None:
+        return row[0], dump_form_data(still_pending)
+    return row
+
+# Nothing queued may be lost when the server stops.
+app.on_shutdown(_flush_pending_form_data_on_shutdown)
 
 # ===================================================================
 # 4. CORE LOGIC & NAVIGATION (With DB Persistence)
 # ===================================================================
 
 # --- Validation Helpers (from your original file) ---
-def _validate_simple_field(field_key: str, validator_list: list[ValidatorFunc], form_data: dict[str, Any], errors: dict[str, str]) -> bool:
+def _validate_simple_field(field_key: str, validator_list: ValidatorChain, form_data: dict[str, Any], errors: dict[str, str]) -> bool:
+    if not validator_list: return True # Nothing to check; skip the value lookup too.
     is_field_valid = True
     value_to_validate = form_data.get(field_key)
     for validator_func in validator_list:
@@ -133,215 +284,317 @@ def _validate_simple_field(field_key: str, validator_list: list[ValidatorFunc],
             break
     return is_field_valid
 
-def _validate_dataframe_field(dataframe_key: str, column_rules: DataframeColumnRules, form_data: dict[str, Any], errors: dict[str, str]) -> bool:
+def _validate_dataframe_field(dataframe_key: str, rules_items: DataframeColumnRuleItems, form_data: dict[str, Any], errors: dict[str, str]) -> bool:
     is_dataframe_valid = True
-    dataframe_value = form_data.get(dataframe_key, [])
+    dataframe_value = form_data.get(dataframe_key) or () # None-safe, no list allocation
+    # rules_items comes pre-frozen from the step's validation plan.
     for row_index, row_data in enumerate(dataframe_value):
-        for col_key, validator_list in column_rules.items():
-            cell_value = row_data.get(col_key)
+        # Error keys stay strings ("<df>_<row>_<col>") because the error dict
+        # lives in JSON-backed session storage; build the row part once.
+        row_error_prefix = f"{dataframe_key}_{row_index}_"
+        row_get = row_data.get
+        for col_key, validator_list in rules_items:
+            cell_value = row_get(col_key)
             for validator_func in validator_list:
                 is_valid, msg = validator_func(cell_value, row_data)
                 if not is_valid:
                     is_dataframe_valid = False
-                    error_key = f"{dataframe_key}_{row_index}_{col_key}"
+                    error_key = row_error_prefix + col_key
                     if error_key not in errors: errors[error_key] = msg
                     break
     return is_dataframe_valid
 
-def execute_step_validators(step_def: StepDefinition, form_data: dict[str, Any]) -> tuple[bool, dict[str, str]]:
+def execute_step_validators(plan: StepValidationPlan, form_data: dict[str, Any],
+                            dirty: Mapping[str, Any] | None = None, previous_errors: Mapping[str, str] | None = None) -> tuple[bool, dict[str, str]]:
+    """
+    Runs every validator of a step. When `dirty` is given, simple fields not
+    in it keep their result from `previous_errors` instead of being re-run;
+    dataframes always re-run.
+    """
     new_errors: dict[str, str] = {}
     is_step_valid = True
-    for field_conf in step_def.get('fields', []):
-        if not _validate_simple_field(field_conf['field'].key, field_conf['validators'], form_data, new_errors):
+    for key, validator_list in plan.simple:
+        if dirty is not None and key not in dirty:
+            previous_error = previous_errors.get(key) if previous_errors else None
+            entry_valid = previous_error is None
+            if previous_error is not None: new_errors[key] = previous_error
+        else:
+            entry_valid = _validate_simple_field(key, validator_list, form_data, new_errors)
+        if not entry_valid:
             is_step_valid = False
-    for df_conf in step_def.get('dataframes', []):
-        if not _validate_dataframe_field(df_conf['field'].key, df_conf['validators'], form_data, new_errors):
+    for key, rules_items in plan.dataframes:
+        if not _validate_dataframe_field(key, rules_items, form_data, new_errors):
             is_step_valid = False
     return is_step_valid, new_errors
 
 # --- Navigation (Now with persistence) ---
+def _get_current_step_def(form_data: dict[str, Any]) -> StepDefinition | None:
+    """O(1) lookup of the step the user is on."""
+    return STEPS_BY_ID.get(form_data.get(STEP_KEY, 0))
+
+MAX_NOTIFIED_ERRORS: int = 5 # Remaining errors are still shown inline under each field.
+
+def validate_step_attempt(plan: StepValidationPlan, form_data: dict[str, Any]) -> tuple[bool, dict[str, str]]:
+    """
+    Validates a confirm attempt and records it in form_data: the attempt
+    flag, the errors, and edit tracking (restarted while the step has
+    errors, dropped once it is valid).
+    """
+    # After a failed attempt on this step, only fields edited since are re-run
+    # (dirty is None on a first attempt, which validates everything).
+    all_valid, new_errors = execute_step_validators(
+        plan, form_data,
+        dirty=form_data.get(DIRTY_FIELDS_KEY), previous_errors=form_data.get(CURRENT_STEP_ERRORS_KEY, {}),
+    )
+    form_data[FORM_ATTEMPTED_SUBMISSION_KEY] = True
+    form_data[CURRENT_STEP_ERRORS_KEY] = new_errors
+    if all_valid:
+        form_data.pop(DIRTY_FIELDS_KEY, None)
+    else:
+        form_data[DIRTY_FIELDS_KEY] = {}
+    return all_valid, new_errors
+
 async def _handle_step_confirmation(button: ui.button) -> None:
     button.disable()
     try:
         form_data = get_form_data()
-        current_step_id = form_data.get(STEP_KEY, 0)
-        current_step_def = STEPS_BY_ID.get(current_step_id)
+        current_step_def = _get_current_step_def(form_data)
         if not current_step_def: return
+        current_step_id = current_step_def.id
 
-        all_valid, new_errors = execute_step_validators(current_step_def, form_data)
-        form_data[FORM_ATTEMPTED_SUBMISSION_KEY] = True
-        form_data[CURRENT_STEP_ERRORS_KEY] = new_errors
+        all_valid, new_errors = validate_step_attempt(VALIDATION_PLAN_BY_STEP_ID[current_step_id], form_data)
 
         if all_valid:
             if current_step_id == 0:
                 form_data[SELECTED_USE_CASE_KEY] = form_data.get(AppSchema.FORM_TEMPLATE_SELECTOR.key)
             
-            # --->>> SAVE TO DB ON SUCCESS <<<---
-            save_form_data_to_db() 
-            
             ui.notify("Thông tin hợp lệ!", type='positive')
-            next_step()
+            next_step(form_data)
+
+            # --->>> SAVE TO DB ON SUCCESS <<<---
+            # Queued after the step has advanced, so the saved state includes it.
+            save_form_data_to_db()
         else:
-            for error_message in new_errors.values():
-                ui.notification(error_message, type='negative', multi_line=True)
+            if new_errors:
+                # One toast for the whole step rather than one per invalid field.
+                error_messages = list(new_errors.values())
+                shown = error_messages[:MAX_NOTIFIED_ERRORS]
+                if len(error_messages) > MAX_NOTIFIED_ERRORS:
+                    shown.append(f"… và {len(error_messages) - MAX_NOTIFIED_ERRORS} lỗi khác.")
+                ui.notify('\n'.join(shown), type='negative', multi_line=True, close_button=True,
+                          classes='multi-line-notification')
             update_step_content.refresh()
     finally:
         button.enable()
 
-def _get_current_form_template() -> FormTemplate | None:
-    form_data = get_form_data()
+# FORM_TEMPLATE_REGISTRY is never mutated at runtime, so lookups by use-case
+# name can be cached for the lifetime of the process. Unknown names are not
+# cached, which keeps the dict bounded by the registry size.
+_TEMPLATE_CACHE: dict[str, FormTemplate] = {}
+
+def _get_current_form_template(form_data: dict[str, Any]) -> FormTemplate | None:
     use_case_value_str = form_data.get(SELECTED_USE_CASE_KEY)
     if not use_case_value_str: return None
+    cached = _TEMPLATE_CACHE.get(use_case_value_str)
+    if cached is not None: return cached
     try:
         selected_use_case = FormUseCaseType[use_case_value_str]
-        return FORM_TEMPLATE_REGISTRY.get(selected_use_case)
     except KeyError: return None
+    form_template = FORM_TEMPLATE_REGISTRY.get(selected_use_case)
+    if form_template is not None:
+        _TEMPLATE_CACHE[use_case_value_str] = form_template
+    return form_template
 
 def calculate_next_step_id(current_step_id: int, form_template: FormTemplate | None) -> int:
     """Calculates the ID of the next step in the sequence."""
     if not form_template:
         return 0
-    
-    step_sequence: list[int] = form_template['step_sequence']
-    if not step_sequence:
-        return 0
-    
-    if current_step_id == 0:
-        return step_sequence[0]
-
-    try:
-        current_index: int = step_sequence.index(current_step_id)
-        if current_index < len(step_sequence) - 1:
-            return step_sequence[current_index + 1]
-        return current_step_id # Stay on the last step if there's no next one
-    except ValueError:
-        return 0 # Go to start if current step isn't in sequence
+    # Unknown steps (and empty sequences) go back to the start.
+    return form_template['next_step_map'].get(current_step_id, 0)
 
 def calculate_prev_step_id(current_step_id: int, form_template: FormTemplate | None) -> int:
     """Calculates the ID of the previous step in the sequence."""
-    if not form_template or current_step_id == 0:
-        return 0
-
-    step_sequence: list[int] = form_template['step_sequence']
-    try:
-        current_index: int = step_sequence.index(current_step_id)
-        return step_sequence[current_index - 1] if current_index > 0 else 0
-    except ValueError:
+    if not form_template:
         return 0
+    return form_template['prev_step_map'].get(current_step_id, 0)
+
+def _go_to_step(form_data: dict[str, Any], step_id: int) -> None:
+    """Moves to `step_id` with a clean validation state, then re-renders."""
+    # Only keys that actually change are written: each storage write is a
+    # change notification and a re-serialization of the session.
+    changes: dict[str, Any] = {}
+    if form_data.get(STEP_KEY, 0) != step_id:
+        changes[STEP_KEY] = step_id
+    if form_data.get(FORM_ATTEMPTED_SUBMISSION_KEY):
+        changes[FORM_ATTEMPTED_SUBMISSION_KEY] = False
+    if form_data.get(CURRENT_STEP_ERRORS_KEY):
+        changes[CURRENT_STEP_ERRORS_KEY] = {}
+    # Nothing to change (e.g. Back on step 0, Next on the last step) means
+    # an identical page, so the re-render is skipped too.
+    if not changes:
+        return
+    form_data.update(changes) # One update (one notification) for the whole transition.
+    form_data.pop(DIRTY_FIELDS_KEY, None) # Edit tracking is per step.
+    update_step_content.refresh()
 
-def next_step() -> None:
-    form_data = get_form_data()
-    form_template = _get_current_form_template()
+def next_step(form_data: dict[str, Any] | None = None) -> None:
+    # Callers that already hold form_data pass it to skip another storage read.
+    if form_data is None:
+        form_data = get_form_data()
+    form_template = _get_current_form_template(form_data)
 
     current_step_id = form_data.get(STEP_KEY, 0)
     next_step_id: int = calculate_next_step_id(current_step_id, form_template)
-    
-    form_data[STEP_KEY] = next_step_id
-    form_data[FORM_ATTEMPTED_SUBMISSION_KEY] = False
-    update_step_content.refresh()
+    _go_to_step(form_data, next_step_id)
 
-def prev_step() -> None:
-    form_data = get_form_data()
-    form_template = _get_current_form_template()
+def prev_step(form_data: dict[str, Any] | None = None) -> None:
+    if form_data is None:
+        form_data = get_form_data()
+    form_template = _get_current_form_template(form_data)
     
     current_step_id = form_data.get(STEP_KEY, 0)
     prev_step_id: int = calculate_prev_step_id(current_step_id, form_template)
-
-    form_data[STEP_KEY] = prev_step_id
-    form_data[FORM_ATTEMPTED_SUBMISSION_KEY] = False
-    update_step_content.refresh()
+    _go_to_step(form_data, prev_step_id)
 
 # ===================================================================
 # 5. UI RENDERING & PDF (Unchanged Logic, but now reads from DB via helpers)
 # ===================================================================
 
+# --- PDF rendering constants (resolved once at import) ---
+FONT_PATH: str = str(PROJECT_ROOT / "assets" / "NotoSans-Regular.ttf")
+FONT_NAME: str = "NotoSans"
+FONT_SIZE: int = 10
+LINE_HEIGHT: float = 21.5
+FONT_FILE_EXISTS: bool = Path(FONT_PATH).exists()
+if not FONT_FILE_EXISTS:
+    logger.error(f"Font not found at {FONT_PATH}. PDF generation will fail.")
+# Template files are fixed at deploy time too, so they are checked once
+# here instead of with a stat() on every preview or download click.
+TEMPLATE_FILE_EXISTS: dict[FormUseCaseType, bool] = {
+    use_case: Path(form_template['pdf_template_path']).exists()
+    for use_case, form_template in FORM_TEMPLATE_REGISTRY.items()
+}
+for _use_case, _exists in TEMPLATE_FILE_EXISTS.items():
+    if not _exists:
+        logger.error(f"PDF template for {_use_case.name} not found. PDF generation will fail for it.")
+
+# Simple fields that actually draw for a use case, with their coordinates.
+# The schema is static, so each list is built on first use and reused.
+PDFCoords = tuple[float, float] | tuple[list[float], float]
+_PDF_DRAW_LISTS: dict[FormUseCaseType, list[tuple[FormField, PDFCoords]]] = {}
+
+def _get_pdf_draw_list(use_case: FormUseCaseType) -> list[tuple[FormField, PDFCoords]]:
+    draw_list = _PDF_DRAW_LISTS.get(use_case)
+    if draw_list is None:
+        draw_list = []
+        for field in AppSchema.get_all_fields():
+            if field.pdf_columns or not field.pdf_coords:
+                continue  # Dataframes are drawn separately; some fields never draw.
+            coords = field.pdf_coords.get(use_case)
+            if coords:
+                draw_list.append((field, coords))
+        _PDF_DRAW_LISTS[use_case] = draw_list
+    return draw_list
+
+# Dataframe fields that draw onto the PDF, keyed like dataframe_page_map.
+_PDF_DATAFRAME_FIELDS: dict[str, FormField] = {
+    field.key: field for field in AppSchema.get_all_fields() if field.pdf_columns
+}
+
+def _column_text_getter(key: str) -> Callable[[dict[str, Any]], str]:
+    return lambda row: str(row.get(key, ''))
+
+def _compile_pdf_columns(pdf_columns: list[PDFColumn]) -> list[tuple[Callable[[dict[str, Any]], str], float]]:
+    """Pairs each column's text getter with its x offset for the row loop."""
+    return [
+        (col_def.get('transformer') or _column_text_getter(col_def['key']), col_def['x_offset'])
+        for col_def in pdf_columns
+    ]
+
+@lru_cache(maxsize=8)
+def _read_template_bytes(template_path: Path) -> bytes:
+    """Reads a template once; every render opens a fresh Document from these bytes."""
+    return template_path.read_bytes()
+
 def render_text_on_pdf(
     template_path: Path,
     form_data: dict[str, Any],
     form_template: FormTemplate,
-    output_path: Path,
-) -> None:
+    output_path: Path | None = None,
+) -> bytes | None:
     """
     Renders form data onto a template PDF using the robust PyMuPDF (fitz) library.
-    This is the final, production-ready engine.
+    This is the final, production-ready engine. Writes to output_path when
+    given; otherwise returns the serialized PDF as bytes.
     """
+    # PyMuPDF is only needed here, so importing it is deferred until the
+    # first PDF instead of slowing every server start.
+    import fitz
+
     try:
         # 1. --- SETUP ---
-        PROJECT_ROOT: Path = Path(__file__).resolve().parent.parent
-        FONT_PATH: str = str(PROJECT_ROOT / "assets" / "NotoSans-Regular.ttf")
         # We now know the original template is fine, no need for the "-CLEAN" version.
         TEMPLATE_FILE: Path = template_path 
 
-        FONT_NAME: str = "NotoSans"
-        FONT_SIZE: int = 10
-        LINE_HEIGHT: float = 21.5
-
-        if not Path(FONT_PATH).exists():
+        if not FONT_FILE_EXISTS:
             raise FileNotFoundError(f"CRITICAL: Font not found at {FONT_PATH}")
-        if not TEMPLATE_FILE.exists():
-            raise FileNotFoundError(f"CRITICAL: Template not found at {TEMPLATE_FILE}")
+        # A missing template surfaces as FileNotFoundError from the read below.
 
-        doc = fitz.open(TEMPLATE_FILE)
+        doc = fitz.open(stream=_read_template_bytes(TEMPLATE_FILE), filetype='pdf')
         selected_use_case = FormUseCaseType[cast(str, form_data.get(SELECTED_USE_CASE_KEY))]
 
+        # Embed the font once per page; insert_text then refers to it by name.
+        for doc_page in doc:
+            doc_page.insert_font(fontname=FONT_NAME, fontfile=FONT_PATH)
+
         # 2. --- DRAW ALL DATA ---
         # Process simple fields
-        for field in AppSchema.get_all_fields():
-            if field.pdf_columns:
-                continue  # This correctly skips only the dataframe fields.
-            
-            if not field.pdf_coords:
-                continue
-
-            coords = field.pdf_coords.get(selected_use_case)
-            if not coords:
-                continue
-            
-            page = doc[0] # All simple fields are on page 1 (index 0)
+        page = doc[0] # All simple fields are on page 1 (index 0)
+        for field, coords in _get_pdf_draw_list(selected_use_case):
             value = form_data.get(field.key, '')
 
-            # Use a consistent 'insert' method for all text
-            def insert(point: tuple[float, float], text: str):
-                page.insert_text(point, text, fontname=FONT_NAME, fontfile=FONT_PATH, fontsize=FONT_SIZE)
-
             if field.ui_type == 'date' and field.split_date and value:
                 try:
-                    dt_obj = datetime.strptime(str(value), '%Y-%m-%d')
-                    day, month, year = dt_obj.strftime('%d'), dt_obj.strftime('%m'), dt_obj.strftime('%Y')
+                    # Dates are stored zero-padded as YYYY-MM-DD, so a split is enough.
+                    year, month, day = str(value).split('-')
                     x_coords, y = cast(tuple[list[float], float], coords)
                     if len(x_coords) == 3:
-                        insert((x_coords[0], y), day)
-                        insert((x_coords[1], y), month)
-                        insert((x_coords[2], y), year)
+                        page.insert_text((x_coords[0], y), day, fontname=FONT_NAME, fontsize=FONT_SIZE)
+                        page.insert_text((x_coords[1], y), month, fontname=FONT_NAME, fontsize=FONT_SIZE)
+                        page.insert_text((x_coords[2], y), year, fontname=FONT_NAME, fontsize=FONT_SIZE)
                 except (ValueError, TypeError):
                     pass
             else:
                 x, y = cast(tuple[float, float], coords)
-                insert((x, y), str(value))
+                page.insert_text((x, y), str(value), fontname=FONT_NAME, fontsize=FONT_SIZE)
 
         # Process multi-row dataframe fields
         for df_key, page_num in form_template['dataframe_page_map'].items():
             page = doc[page_num - 1]
             
-            df_field = getattr(AppSchema, df_key.upper(), None)
+            df_field = _PDF_DATAFRAME_FIELDS.get(df_key)
             if not df_field or not df_field.pdf_coords: continue
-            coords = df_field.pdf_coords.get(selected_use_case)
-            if not coords: continue
+            df_coords = df_field.pdf_coords.get(selected_use_case)
+            if not df_coords: continue
                 
-            start_x, start_y = cast(tuple[float, float], coords)
+            start_x, start_y = cast(tuple[float, float], df_coords)
             dataframe_data = cast(list[dict[str, Any]], form_data.get(df_key, []))
-            pdf_columns = getattr(df_field, 'pdf_columns', [])
+            compiled_columns = _compile_pdf_columns(df_field.pdf_columns or [])
 
             for i, row in enumerate(dataframe_data):
                 y_pos = start_y + (i * LINE_HEIGHT)
-                for col_def in pdf_columns:
-                    text = col_def['transformer'](row) if 'transformer' in col_def else str(row.get(col_def['key'], ''))
-                    point = fitz.Point(start_x + col_def['x_offset'], y_pos)
-                    page.insert_text(point, text, fontname=FONT_NAME, fontfile=FONT_PATH, fontsize=FONT_SIZE-2)
+                for get_text, x_offset in compiled_columns:
+                    point = fitz.Point(start_x + x_offset, y_pos)
+                    page.insert_text(point, get_text(row), fontname=FONT_NAME, fontsize=FONT_SIZE-2)
 
         # 3. --- SAVE THE MODIFIED DOCUMENT ---
+        if output_path is None:
+            pdf_bytes: bytes = doc.tobytes(garbage=4, deflate=True, clean=True)
+            logger.info(f"PDF generated in memory ({len(pdf_bytes)} bytes).")
+            return pdf_bytes
         doc.save(output_path, garbage=4, deflate=True, clean=True)
         print(f"✅ PDF successfully generated with Fitz engine and saved to {output_path}")
+        return None
 
     except Exception as e:
         print(f"!!! PDF GENERATION FAILED with an exception: {e}")
@@ -353,14 +606,41 @@ def render_text_on_pdf(
 # 4. UI RENDERING ENGINE
 # ===================================================================
 
-def _render_dataframe_editor(df_conf: DataframeConfig) -> None:
+@dataclass(slots=True)
+class RenderContext:
+    """Session state fetched once per render pass and shared by every field."""
+    form_data: dict[str, Any]
+    form_attempted: bool
+    current_errors: dict[str, str]
+
+def _build_render_context() -> RenderContext:
+    form_data = get_form_data()
+    return RenderContext(
+        form_data=form_data,
+        form_attempted=form_data.get(FORM_ATTEMPTED_SUBMISSION_KEY, False),
+        current_errors=form_data.get(CURRENT_STEP_ERRORS_KEY, {}),
+    )
+
+@lru_cache(maxsize=None)
+def _get_row_columns(row_schema: type) -> tuple[tuple[FormField, ...], tuple[FormField, ...]]:
+    """Splits a row schema's fields into (date_fields, other_fields), once per schema."""
+    column_definitions = [
+        field for field in row_schema.__dict__.values()
+        if isinstance(field, FormField)
+    ]
+    date_fields = tuple(f for f in column_definitions if f.ui_type == 'date')
+    other_fields = tuple(f for f in column_definitions if f.ui_type != 'date')
+    return date_fields, other_fields
+
+def _render_dataframe_editor(df_conf: DataframeConfig, ctx: RenderContext) -> None:
     """
     Renders a dynamic list of cards by reading the data structure
-    directly from the AppSchema.
+    directly from the AppSchema. Adding or deleting a row only touches that
+    row's card; a validation attempt re-renders the whole step with a fresh ctx.
     """
     # 1. Get the main definition for the entire dataframe from the config.
-    main_df_field = df_conf['field']
-    ui.label(df_conf['field'].label).classes('text-subtitle1 q-mt-md q-mb-sm')
+    main_df_field = df_conf.field
+    ui.label(main_df_field.label).classes('text-subtitle1 q-mt-md q-mb-sm')
     dataframe_key = main_df_field.key
 
     # 2. Get the column definitions from the SSoT: AppSchema.
@@ -368,65 +648,101 @@ def _render_dataframe_editor(df_conf: DataframeConfig) -> None:
         ui.label(f"Lỗi cấu hình: Dataframe '{main_df_field.key}' không có row_schema.").classes('text-negative')
         return
     
-    column_definitions: list[FormField] = [
-        field for field in main_df_field.row_schema.__dict__.values()
-        if isinstance(field, FormField)
-    ]
-
-    @ui.refreshable
-    def render_cards() -> None:
-        form_data = get_form_data()
-        data_list = cast(list[dict[str, Any]], form_data.get(dataframe_key, []))
-        if not data_list:
-            ui.label("Chưa có mục nào được thêm.").classes("text-italic text-grey q-pa-md text-center full-width")
-        for i, row_data in enumerate(data_list):
-            # The card now has a subtle border and shadow for depth
-            with ui.card().classes('w-full q-mb-md').props("bordered flat"):
-                # Clean header with flexbox for alignment
-                with ui.card_section().classes('w-full !py-2'):
-                    with ui.row().classes('w-full justify-between items-center no-wrap'):
-                        ui.label(f"{main_df_field.label} #{i + 1}").classes('text-bold text-body1')
-                        ui.button(icon='delete_outline', on_click=lambda _, idx=i: (data_list.pop(idx), render_cards.refresh()), color='grey-6').props('flat dense round padding=xs')
-                
-                ui.separator()
-                
-                # Two-column layout for the fields
-                with ui.card_section():
-                    date_fields = [f for f in column_definitions if f.ui_type == 'date']
-                    other_fields = [f for f in column_definitions if f.ui_type != 'date']
-
-                    with ui.row().classes('w-full'):
-                        for col_field_def in date_fields:
-                            # Each date component lives in a 'col' to space them evenly.
-                            with ui.column().classes('col'):
-                                create_field(
-                                    field_definition=col_field_def,
-                                    data_source=row_data,
-                                    error_key_prefix=f"{dataframe_key}_{i}_"
-                                )
-                        # Right column for all other text/select inputs
-                        for col_field_def in other_fields:
+    date_fields, other_fields = _get_row_columns(main_df_field.row_schema)
+
+    data_list = cast(list[dict[str, Any]], ctx.form_data.setdefault(dataframe_key, []))
+    # Cards are added and removed one at a time instead of re-rendering the
+    # whole list; these run parallel to data_list (same index, same row).
+    row_cards: list[ui.card] = []
+    row_titles: list[ui.label] = []
+
+    cards_container = ui.column().classes('w-full no-wrap')
+    with cards_container:
+        empty_label = ui.label("Chưa có mục nào được thêm.").classes("text-italic text-grey q-pa-md text-center full-width")
+    empty_label.set_visibility(not data_list)
+
+    def render_card(row_data: dict[str, Any]) -> None:
+        i = len(row_cards)
+        # The card now has a subtle border and shadow for depth
+        with cards_container, ui.card().classes('w-full q-mb-md').props("bordered flat") as card:
+            # Clean header with flexbox for alignment
+            with ui.card_section().classes('w-full !py-2'):
+                with ui.row().classes('w-full justify-between items-center no-wrap'):
+                    title = ui.label(f"{main_df_field.label} #{i + 1}").classes('text-bold text-body1')
+                    ui.button(icon='delete_outline', on_click=partial(delete_row, row_data), color='grey-6').props('flat dense round padding=xs')
+            
+            ui.separator()
+            
+            # Two-column layout for the fields
+            row_error_prefix = f"{dataframe_key}_{i}_"
+            with ui.card_section():
+                with ui.row().classes('w-full'):
+                    for col_field_def in date_fields:
+                        # Each date component lives in a 'col' to space them evenly.
+                        with ui.column().classes('col'):
                             create_field(
                                 field_definition=col_field_def,
+                                ctx=ctx,
                                 data_source=row_data,
-                                error_key_prefix=f"{dataframe_key}_{i}_"
+                                error_key_prefix=row_error_prefix
                             )
+                    # Right column for all other text/select inputs
+                    for col_field_def in other_fields:
+                        create_field(
+                            field_definition=col_field_def,
+                            ctx=ctx,
+                            data_source=row_data,
+                            error_key_prefix=row_error_prefix
+                        )
+        row_cards.append(card)
+        row_titles.append(title)
+
+    def delete_row(row_data: dict[str, Any]) -> None:
+        # Look the row up by identity: earlier deletes shift the indices.
+        idx = next(i for i, row in enumerate(data_list) if row is row_data)
+        data_list.pop(idx)
+        _mark_form_changed(ctx.form_data)
+        row_cards.pop(idx).delete()
+        row_titles.pop(idx)
+        for j in range(idx, len(row_titles)):
+            row_titles[j].set_text(f"{main_df_field.label} #{j + 1}")
+        empty_label.set_visibility(not data_list)
 
     def add_new_row() -> None:
-        form_data = get_form_data()
-        data_list: list[dict[str, Any]] = form_data.setdefault(dataframe_key, [])
         data_list.append({})
-        render_cards.refresh()
+        _mark_form_changed(ctx.form_data)
+        # Bind to the stored row: session storage may wrap the appended dict.
+        render_card(data_list[-1])
+        empty_label.set_visibility(False)
 
-    render_cards()
-    ui.button(f"Thêm {df_conf['field'].label}", on_click=add_new_row, icon='add').classes('q-mt-sm').props('outline color=primary')
+    for row_data in data_list:
+        render_card(row_data)
+    ui.button(f"Thêm {main_df_field.label}", on_click=add_new_row, icon='add').classes('q-mt-sm').props('outline color=primary')
 
 # ===================================================================
 # UI CREATION HELPERS (Moved from utils.py)
 # ===================================================================
+# Option values for the composite date picker, shared by every instance.
+# Kept immutable; ui.select gets its own list() copy, since any non-list
+# options value is treated as a dict.
+_DAY_OPTIONS: tuple[int, ...] = tuple(range(1, 32))
+_MONTH_OPTIONS: tuple[int, ...] = tuple(range(1, 13))
+_DAYS_IN_MONTH: tuple[int, ...] = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+@lru_cache(maxsize=2)
+def _get_year_options(current_year: int) -> tuple[int, ...]:
+    """Years from current_year down to 1901; rebuilt at most once a year."""
+    return tuple(range(current_year, 1900, -1))
+
+def _days_in_month(year: int, month: int) -> int:
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 29
+    return _DAYS_IN_MONTH[month - 1]
+
 def _create_composite_date_input(
     field: FormField,
     data_source: dict[str, Any],
+    form_data: dict[str, Any],
     current_errors: dict[str, str],
     error_key: str,
     form_attempted: bool
@@ -451,24 +767,26 @@ def _create_composite_date_input(
 
     # 2. Use a plain Python dictionary for local state (no changes here)
     state = {'d': d, 'm': m, 'y': y}
+    # Resolved once; the per-part flags below only add the "part is empty" check.
+    field_has_error = bool(form_attempted and current_errors.get(error_key))
 
     # 3. The sync function remains the brain (no changes here)
     def sync_model() -> None:
         if not (state['y'] and state['m']):
-            data_source[field.key] = None
+            _set_field_value(form_data, data_source, field.key, None)
             return
 
         if field.include_day:
             if state['d']:
                 try:
                     # This will raise a ValueError for an invalid date like Feb 30
-                    data_source[field.key] = date(state['y'], state['m'], state['d']).strftime('%Y-%m-%d')
+                    _set_field_value(form_data, data_source, field.key, date(state['y'], state['m'], state['d']).strftime('%Y-%m-%d'))
                 except ValueError:
-                    data_source[field.key] = None
+                    _set_field_value(form_data, data_source, field.key, None)
             else:
-                data_source[field.key] = None
+                _set_field_value(form_data, data_source, field.key, None)
         else:
-            data_source[field.key] = f"{state['m']:02d}/{state['y']}"
+            _set_field_value(form_data, data_source, field.key, f"{state['m']:02d}/{state['y']}")
 
     # 4. EXPLICIT HANDLERS - with one small change
     
@@ -478,12 +796,9 @@ def _create_composite_date_input(
             state['d'] = e.value
             sync_model()
             
-        # --- THIS IS THE ONLY LINE THAT CHANGES ---
         # Always show days 1-31, letting the logic below handle validation.
-        day_options = list(range(1, 32))
-        
-        is_error = form_attempted and current_errors.get(error_key) and not state['d']
-        ui.select(day_options, value=state['d'], label='Ngày', on_change=handle_day_change).classes('col').props(f"outlined dense error={is_error}")
+        is_error = field_has_error and not state['d']
+        ui.select(list(_DAY_OPTIONS), value=state['d'], label='Ngày', on_change=handle_day_change).classes('col').props(f"outlined dense error={is_error}")
 
     # The auto-correction logic was already here and works perfectly.
     def handle_month_year_change() -> None:
@@ -491,7 +806,7 @@ def _create_composite_date_input(
         # If a month/year is selected, check if the current day is valid.
         if field.include_day and state['y'] and state['m']:
             # Find the last valid day of the selected month/year.
-            max_days = calendar.monthrange(state['y'], state['m'])[1]
+            max_days = _days_in_month(state['y'], state['m'])
             # If the user's selected day is greater, cap it at the max.
             if state['d'] and state['d'] > max_days:
                 state['d'] = max_days
@@ -515,35 +830,72 @@ def _create_composite_date_input(
             if field.include_day:
                 day_select_container()
 
-            is_m_error = form_attempted and current_errors.get(error_key) and not state['m']
-            ui.select(list(range(1, 13)), value=state['m'], label='Tháng', on_change=handle_month_select).classes('col').props(f"outlined dense error={is_m_error}")
+            is_m_error = field_has_error and not state['m']
+            ui.select(list(_MONTH_OPTIONS), value=state['m'], label='Tháng', on_change=handle_month_select).classes('col').props(f"outlined dense error={is_m_error}")
+
+            is_y_error = field_has_error and not state['y']
+            ui.select(list(_get_year_options(date.today().year)), value=state['y'], label='Năm', on_change=handle_year_select).classes('col').props(f"outlined dense error={is_y_error}")
 
-            is_y_error = form_attempted and current_errors.get(error_key) and not state['y']
-            ui.select(list(range(date.today().year, 1900, -1)), value=state['y'], label='Năm', on_change=handle_year_select).classes('col').props(f"outlined dense error={is_y_error}")
+def _mark_form_changed(form_data: dict[str, Any]) -> None:
+    """Bumps the session-only change counter that the review step's PDF reuse checks."""
+    form_data[FORM_DATA_VERSION_KEY] = form_data.get(FORM_DATA_VERSION_KEY, 0) + 1
 
-def _create_text_input(f: FormField, v: Any, data_source: dict[str, Any]) -> ui.input:
+def _set_field_value(form_data: dict[str, Any], data_source: dict[str, Any], key: str, value: Any) -> None:
+    """
+    Stores an edited value in data_source (form_data itself, or one of its
+    dataframe rows), bumps form_data's change counter and, after a failed
+    confirm, marks the field dirty.
+    """
+    data_source[key] = value
+    _mark_form_changed(form_data)
+    # Dataframe rows never carry the dirty map, so only top-level fields are tracked.
+    dirty = data_source.get(DIRTY_FIELDS_KEY)
+    if dirty is not None:
+        dirty[key] = True
+
+def _update_source(form_data: dict[str, Any], data_source: dict[str, Any], key: str, e: Any) -> None:
+    """Shared on_change handler; bound per widget with functools.partial."""
+    _set_field_value(form_data, data_source, key, e.value)
+
+def _create_text_input(f: FormField, v: Any, data_source: dict[str, Any], form_data: dict[str, Any]) -> ui.input:
     """Creates a standard text input field bound to the data source."""
-    return ui.input(label=f.label, value=v, on_change=lambda e: data_source.update({f.key: e.value}))
+    return ui.input(label=f.label, value=v, on_change=partial(_update_source, form_data, data_source, f.key))
 
-def _create_select_input(f: FormField, v: Any, data_source: dict[str, Any]) -> ui.select:
+def _create_select_input(f: FormField, v: Any, data_source: dict[str, Any], form_data: dict[str, Any]) -> ui.select:
     """Creates a dropdown select field bound to the data source."""
     # assert type(f.options) == dict[str, str]
-    return ui.select(options=f.options or [], label=f.label, value=v, on_change=lambda e: data_source.update({f.key: e.value}))
+    return ui.select(options=f.options or [], label=f.label, value=v, on_change=partial(_update_source, form_data, data_source, f.key))
 
-def _create_radio_buttons(f: FormField, v: Any, data_source: dict[str, Any]) -> ui.radio:
+def _create_radio_buttons(f: FormField, v: Any, data_source: dict[str, Any], form_data: dict[str, Any]) -> ui.radio:
     """Creates a set of radio buttons bound to the data source."""
     # assert type(f.options) == dict[str, str]
-    return ui.radio(options=f.options or [], value=v, on_change=lambda e: data_source.update({f.key: e.value}))
+    return ui.radio(options=f.options or [], value=v, on_change=partial(_update_source, form_data, data_source, f.key))
 
-def _create_textarea_input(f: FormField, v: Any, data_source: dict[str, Any]) -> ui.textarea:
+def _create_textarea_input(f: FormField, v: Any, data_source: dict[str, Any], form_data: dict[str, Any]) -> ui.textarea:
     """Creates a multi-line text area bound to the data source."""
-    return ui.textarea(label=f.label, value=v, on_change=lambda e: data_source.update({f.key: e.value}))
+    return ui.textarea(label=f.label, value=v, on_change=partial(_update_source, form_data, data_source, f.key))
 
-def _create_checkbox_input(f: FormField, v: Any, data_source: dict[str, Any]) -> ui.checkbox:
+def _create_checkbox_input(f: FormField, v: Any, data_source: dict[str, Any], form_data: dict[str, Any]) -> ui.checkbox:
     """Creates a checkbox bound to the data source."""
-    return ui.checkbox(text=f.label, value=bool(v), on_change=lambda e: data_source.update({f.key: e.value}))
+    return ui.checkbox(text=f.label, value=bool(v), on_change=partial(_update_source, form_data, data_source, f.key))
+
+# --- Element Creator Map ---
+# Built once; 'date' fields use the composite picker and are handled separately.
+_CREATOR_MAP: dict[str, Callable[..., Any]] = {
+    'text': _create_text_input,
+    'select': _create_select_input,
+    'radio': _create_radio_buttons,
+    'textarea': _create_textarea_input,
+    'checkbox': _create_checkbox_input,
+}
+
+@lru_cache(maxsize=None)
+def _input_base_props(max_length: int | None) -> str:
+    """Quasar props shared by every input with this max length; built once per limit."""
+    return f"outlined dense maxlength={max_length}" if max_length else "outlined dense"
 
 def create_field(field_definition: FormField,
+                 ctx: RenderContext,
                  data_source: dict[str, Any] | None = None,
                  error_key_prefix: str = "") -> None:
     """
@@ -552,20 +904,22 @@ def create_field(field_definition: FormField,
     """
     # If no specific data_source is given, default to the main form_data
     if data_source is None:
-        data_source = get_form_data()
+        data_source = ctx.form_data
 
     # Ensure the field has a default value in the data_source if it's missing
     if field_definition.key not in data_source:
         data_source[field_definition.key] = field_definition.default_value
 
     current_value = data_source.get(field_definition.key)
-    user_storage = get_form_data()
-    form_attempted: bool = user_storage.get(FORM_ATTEMPTED_SUBMISSION_KEY, False)
-    current_errors: dict[str, str] = user_storage.get(CURRENT_STEP_ERRORS_KEY, {})
-
-    # Construct the unique error key for this field
-    error_key = f"{error_key_prefix}{field_definition.key}"
-    error_message: str | None = current_errors.get(error_key) if form_attempted else None
+    form_attempted = ctx.form_attempted
+    current_errors = ctx.current_errors
+
+    # Errors are only shown after a submit attempt, so skip the lookup until then
+    error_message: str | None = None
+    error_key = ''
+    if form_attempted:
+        error_key = f"{error_key_prefix}{field_definition.key}"
+        error_message = current_errors.get(error_key)
     has_error = bool(error_message)
 
     # --- UI Construction ---
@@ -573,30 +927,20 @@ def create_field(field_definition: FormField,
         # For certain types, we provide the label manually above the element
         
         if field_definition.ui_type == 'date':
-            _create_composite_date_input(field_definition, data_source, 
+            _create_composite_date_input(field_definition, data_source, ctx.form_data,
             current_errors, error_key, form_attempted)
         else:
-            # --- Element Creator Map ---
-            creator_map: dict[str, Callable[..., Any]] = {
-                'text': _create_text_input,
-                'select': _create_select_input,
-                'radio': _create_radio_buttons,
-                'textarea': _create_textarea_input,
-                'checkbox': _create_checkbox_input,
-            }
-            creator = creator_map.get(field_definition.ui_type)
+            creator = _CREATOR_MAP.get(field_definition.ui_type)
             if not creator: raise ValueError(f"Unsupported UI type: {field_definition.ui_type}")
 
-            element = creator(field_definition, current_value, data_source)
-            props_list: list[str] = ['outlined', 'dense']
-            if field_definition.max_length:
-                props_list.append(f"maxlength={field_definition.max_length}")
-            if has_error:
-                props_list.append(f"error-message='{error_message or ""}'")
-                props_list.append('error')
-            
+            element = creator(field_definition, current_value, data_source, ctx.form_data)
             if field_definition.ui_type != 'checkbox':
-                element.props(' '.join(props_list)).classes('w-full')
+                props = _input_base_props(field_definition.max_length)
+                if has_error:
+                    # JSON quoting escapes quotes and backslashes in the message
+                    # so it stays one prop value when NiceGUI parses the string.
+                    props = f"{props} error error-message={json.dumps(error_message)}"
+                element.props(props).classes('w-full')
 
 # --- Generic step renderer now uses the new dataframe renderer ---
 def render_generic_step(step_def: StepDefinition) -> None:
@@ -605,29 +949,31 @@ def render_generic_step(step_def: StepDefinition) -> None:
     This function can now handle both simple vertical layouts and
     complex tabbed layouts, driven entirely by the step's data structure.
     """
-    ui.label(step_def['title']).classes('text-h6 q-mb-xs')
-    ui.markdown(step_def['subtitle'])
+    ui.label(step_def.title).classes('text-h6 q-mb-xs')
+    ui.markdown(step_def.subtitle)
 
     # Render simple field
-    for field_conf in step_def.get('fields', []):
-        create_field(field_definition=field_conf['field'])
+    ctx = _build_render_context()
+    for field_conf in step_def.fields:
+        create_field(field_definition=field_conf.field, ctx=ctx)
 
     # Render dataframe "block" editors
-    for df_conf in step_def.get('dataframes', []):
-        _render_dataframe_editor(df_conf)
+    for df_conf in step_def.dataframes:
+        _render_dataframe_editor(df_conf, ctx)
 
     with ui.row().classes('w-full q-mt-lg justify-between items-center'):
-        if step_def['id'] > 0:
+        if step_def.id > 0:
             ui.button("← Quay lại", on_click=lambda: prev_step()).props('flat color=grey')
         else:
             ui.label()
         confirm_button = ui.button("Xác nhận & Tiếp tục →").props('color=primary unelevated')
         confirm_button.on('click', lambda: _handle_step_confirmation(confirm_button))
 
-def _generate_pdf_bytes(form_data: dict[str, Any]) -> bytes | None:
+async def _generate_pdf_bytes(form_data: dict[str, Any]) -> bytes | None:
     """
     Generates the PDF from form_data and returns it as a bytes object.
-    This is the core, reusable PDF generation logic.
+    This is the core, reusable PDF generation logic. Rendering and file I/O
+    run in a worker thread so the event loop keeps serving other sessions.
     Returns None if generation fails.
     """
     try:
@@ -642,20 +988,17 @@ def _generate_pdf_bytes(form_data: dict[str, Any]) -> bytes | None:
             return None
 
         template_path_obj = Path(form_template['pdf_template_path'])
-        if not template_path_obj.exists():
+        if not TEMPLATE_FILE_EXISTS.get(selected_use_case):
             ui.notify(f"Lỗi: Không tìm thấy file mẫu PDF tại '{template_path_obj}'.", type='negative')
             return None
         
-        # Use an in-memory buffer instead of a temporary file
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as tmpfile:
-            output_path = Path(tmpfile.name)
-            render_text_on_pdf(
-                template_path=template_path_obj,
-                form_data=form_data,
-                form_template=form_template,
-                output_path=output_path
-            )
-            return output_path.read_bytes()
+        # Serialize straight to memory instead of round-tripping a temporary file
+        return await run.io_bound(
+            render_text_on_pdf,
+            template_path=template_path_obj,
+            form_data=form_data,
+            form_template=form_template,
+        )
 
     except Exception as e:
         logger.error(f"Lỗi nghiêm trọng khi tạo PDF: {e}", exc_info=True)
@@ -666,7 +1009,7 @@ async def create_and_download_pdf(button: ui.button) -> None:
     button.disable()
     try:
         form_data = get_form_data()
-        pdf_bytes = _generate_pdf_bytes(form_data)
+        pdf_bytes = await _generate_pdf_bytes(form_data)
 
         if pdf_bytes:
             ui.download(src=pdf_bytes, filename="SoYeuLyLich_DaDien.pdf")
@@ -676,21 +1019,30 @@ async def create_and_download_pdf(button: ui.button) -> None:
 
 def render_review_step(step_def: 'StepDefinition') -> None:
     """A special renderer for the final review step with a PDF preview. This version is Pylance-strict."""
-    ui.label(step_def['title']).classes('text-h6 q-mb-md')
-    ui.markdown(step_def['subtitle'])
+    ui.label(step_def.title).classes('text-h6 q-mb-md')
+    ui.markdown(step_def.subtitle)
 
     preview_container = ui.card().classes('w-full shadow-2').style('height: 65vh; padding: 0;')
     with preview_container:
-        with ui.column().classes('w-full h-full items-center justify-center'):
+        placeholder = ui.column().classes('w-full h-full items-center justify-center')
+        with placeholder:
             ui.icon('visibility', size='xl', color='grey-5')
             ui.label('Bản xem trước PDF sẽ xuất hiện ở đây').classes('text-grey')
+        # h-full = 100% height, w-5/6 = 83.33% width.
+        # Created once; regenerating the preview only swaps its content.
+        iframe_slot = ui.html('').classes('h-full w-5/6 mx-auto')
+        iframe_slot.set_visibility(False)
 
-    pdf_state: dict[str, bytes | None] = {'bytes': None}
+    # 'version' is the form's change counter when the bytes were rendered;
+    # download reuses them only while it is unchanged.
+    pdf_state: dict[str, Any] = {'bytes': None, 'version': None}
 
     async def show_preview(download_button: ui.button) -> None:
         """Generates the PDF and displays it in a full-size iframe."""
         preview_button.disable()
-        pdf_bytes = _generate_pdf_bytes(get_form_data())
+        form_data = get_form_data()
+        version = form_data.get(FORM_DATA_VERSION_KEY, 0)
+        pdf_bytes = await _generate_pdf_bytes(form_data)
 
         if not pdf_bytes:
             ui.notify("Không thể tạo bản xem trước.", type='negative')
@@ -698,15 +1050,15 @@ def render_review_step(step_def: 'StepDefinition') -> None:
             return
         
         pdf_state['bytes'] = pdf_bytes
+        pdf_state['version'] = version
         base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
         data_url = f'data:application/pdf;base64,{base64_pdf}'
 
-        preview_container.clear()
-        with preview_container:
-            # h-full = 100% height, w-5/6 = 83.33% width.
-            html_content = f'<iframe src="{data_url}" style="width: 100%; height: 100%; border: none;"></iframe>'
-            ui.html(html_content).classes('h-full w-5/6 mx-auto')
-        
+        html_content = f'<iframe src="{data_url}" style="width: 100%; height: 100%; border: none;"></iframe>'
+        iframe_slot.set_content(html_content)
+        iframe_slot.set_visibility(True)
+        placeholder.set_visibility(False)
+
         download_button.set_visibility(True)
         # Change the preview button's text and icon after first use.
         preview_button.props('icon=refresh')
@@ -714,9 +1066,13 @@ def render_review_step(step_def: 'StepDefinition') -> None:
         ui.notify("Đã tạo bản xem trước thành công.", type='positive')
         preview_button.enable()
 
-    def download_action() -> None:
-        """Type-safe download handler."""
-        if pdf_state['bytes'] is not None:
+    async def download_action() -> None:
+        """Type-safe download handler; rebuilds the PDF first if the form was edited since the preview."""
+        def is_current() -> bool:
+            return pdf_state['bytes'] is not None and pdf_state['version'] == get_form_data().get(FORM_DATA_VERSION_KEY, 0)
+        if not is_current():
+            await show_preview(download_button)
+        if is_current():
             ui.download(pdf_state['bytes'], 'SoYeuLyLich_DaDien.pdf')
         else:
             ui.notify("Lỗi: Không có file PDF để tải xuống.", type='negative')
@@ -738,29 +1094,45 @@ def render_review_step(step_def: 'StepDefinition') -> None:
 # ===================================================================
 # 5. DEFINE THE BLUEPRINT & NAVIGATION ENGINE
 # =================================================================== 
+# The application, not the data, decides how to render. The choice is
+# fixed per step, so it is bound once here rather than on every refresh.
+_RENDER_BY_STEP_ID: Mapping[int, Callable[[], None]] = {
+    step_id: partial(render_review_step if step_def.name == 'review' else render_generic_step, step_def)
+    for step_id, step_def in STEPS_BY_ID.items()
+}
+
 @ui.refreshable
 def update_step_content() -> None:
     """
-    This function now acts as the controller. It fetches the step data,
-    inspects it, and decides which rendering function to call.
+    This function now acts as the controller. It fetches the step data
+    and calls the step's pre-bound rendering function.
     """
     form_data = get_form_data()
-    current_step_id: int = form_data.get(STEP_KEY, 0)
-    step_to_render = STEPS_BY_ID.get(current_step_id)
-    if not step_to_render:
-        ui.label(f"Lỗi: Bước không xác định ({current_step_id})").classes('text-negative text-h6')
+    step_id = form_data.get(STEP_KEY, 0)
+    render_step = _RENDER_BY_STEP_ID.get(step_id)
+    if render_step is None:
+        ui.label(f"Lỗi: Bước không xác định ({step_id})").classes('text-negative text-h6')
         return
-    # The application, not the data, decides how to render.
-    # This is the new logic.
-    if step_to_render.get('name') == 'review':
-        render_review_step(step_to_render)
-    else:
-        render_generic_step(step_to_render)
+    render_step()
 
 # ===================================================================
 # 6. PAGE ROUTING & AUTH (Now DB-driven)
 # ===================================================================
 
+# The starting form data is identical for every new account, so it is
+# serialized once at import and stored verbatim on signup.
+def _build_default_form_data_json() -> str:
+    initial_data: dict[str, Any] = {
+        STEP_KEY: 0,
+        SELECTED_USE_CASE_KEY: None,
+        FORM_ATTEMPTED_SUBMISSION_KEY: False,
+        CURRENT_STEP_ERRORS_KEY: {},
+        **DEFAULT_FIELD_VALUES,
+    }
+    return dump_form_data(initial_data)
+
+_DEFAULT_FORM_DATA_JSON: str = _build_default_form_data_json()
+
 @ui.page('/signup')
 def signup_page() -> None:
     """Page for users to create a new account, now writing to the database."""
@@ -771,7 +1143,7 @@ def signup_page() -> None:
         
         # Your existing validation logic...
         errors = False
-        if not EMAIL_PATTERN.match(username):
+        if not is_email(username):
             username_input.error = "Vui lòng nhập email hợp lệ."; errors = True
         if len(password) < 8:
             password_input.error = "Mật khẩu phải có ít nhất 8 ký tự."; errors = True
@@ -779,21 +1151,13 @@ def signup_page() -> None:
             password_confirm_input.error = "Mật khẩu không khớp."; errors = True
         if errors: return
         
-        # 1. Create the initial, default form data dictionary
-        initial_data: dict[str, Any] = {
-            STEP_KEY: 0,
-            SELECTED_USE_CASE_KEY: None,
-            FORM_ATTEMPTED_SUBMISSION_KEY: False,
-            CURRENT_STEP_ERRORS_KEY: {}
-        }
-        for field in AppSchema.get_all_fields():
-            initial_data[field.key] = field.default_value
-        
-        # 2. Serialize it to a JSON string
-        initial_data_json: str = json.dumps(initial_data)
-        
-        # 3. Hash the password
-        hashed_pass: str = get_password_hash(password)
+        # Hash the password in a worker thread; bcrypt is deliberately slow
+        # and would otherwise stall every other session on the event loop.
+        hashed_pass: str | None = await run.io_bound(get_password_hash, password)
+        if hashed_pass is None:
+            # io_bound skips the call (returns None) while the app is stopping.
+            ui.notify("Đã có lỗi xảy ra, vui lòng thử lại.", color='negative')
+            return
         
         # --- Perform a single, atomic INSERT ---
         try:
@@ -801,8 +1165,8 @@ def signup_page() -> None:
                 cursor = conn.cursor()
                 # Insert username, password, AND form_data all at once.
                 cursor.execute(
-                    "INSERT INTO users (username, hashed_password, form_data) VALUES (?, ?, ?)",
-                    (username, hashed_pass, initial_data_json)
+                    INSERT_USER_SQL,
+                    (username, hashed_pass, _DEFAULT_FORM_DATA_JSON)
                 )
                 conn.commit()
             
@@ -820,7 +1184,7 @@ def signup_page() -> None:
 
     with ui.card().classes('absolute-center'):
         ui.label('Tạo tài khoản mới').classes('text-h6 self-center')
-        username_input = ui.input('Email', on_change=lambda e: (e.value.strip(), setattr(username_input, 'error', None)))
+        username_input = ui.input('Email', on_change=lambda: setattr(username_input, 'error', None))
         password_input = ui.input('Mật khẩu (ít nhất 8 ký tự)', password=True, password_toggle_button=True, on_change=lambda: setattr(password_input, 'error', None))
         password_confirm_input = ui.input('Xác nhận mật khẩu', password=True, on_change=lambda: setattr(password_confirm_input, 'error', None))
         ui.button('Đăng ký', on_click=attempt_signup).classes('self-center w-full q-mt-md')
@@ -829,17 +1193,22 @@ def signup_page() -> None:
 @ui.page('/login')
 def login_page() -> None:
     """Login page, now reads from the database."""
-    def attempt_login() -> None:
+    async def attempt_login() -> None:
         username = username_input.value.strip()
         password = password_input.value
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                # Fetch password AND the form data at the same time
-                cursor.execute("SELECT hashed_password, form_data FROM users WHERE username = ?", (username,))
-                row = cursor.fetchone()
-
-            if not row or not verify_password(password, row['hashed_password']):
+            row = await load_login_row(username)
+            if not row:
+                ui.notify('Sai tên đăng nhập hoặc mật khẩu.', color='negative')
+                return
+            # Plain tuple rows, in SELECT_LOGIN_SQL column order.
+            hashed_password, form_data_json = row
+            password_ok: bool | None = await run.io_bound(verify_password, password, hashed_password)
+            if password_ok is None:
+                # Not checked at all (app stopping): don't report it as a wrong password.
+                ui.notify("Đã có lỗi xảy ra, vui lòng thử lại.", color='negative')
+                return
+            if not password_ok:
                 ui.notify('Sai tên đăng nhập hoặc mật khẩu.', color='negative')
                 return
 
@@ -847,8 +1216,8 @@ def login_page() -> None:
             app.storage.user['authenticated'] = True
             
             # Load the form data from the DB into the session storage
-            if row['form_data']:
-                app.storage.user['form_data'] = json.loads(row['form_data'])
+            if form_data_json:
+                app.storage.user['form_data'] = json.loads(form_data_json)
             else:
                 # Fallback for users who might not have data yet.
                 app.storage.user['form_data'] = {} 
@@ -860,7 +1229,7 @@ def login_page() -> None:
     
     with ui.card().classes('absolute-center'):
         ui.label('Đăng nhập AutoLý').classes('text-h6 self-center')
-        username_input = ui.input('Email', on_change=lambda e: e.value.strip()).on('keydown.enter', attempt_login)
+        username_input = ui.input('Email').on('keydown.enter', attempt_login)
         password_input = ui.input('Mật khẩu', password=True, password_toggle_button=True).on('keydown.enter', attempt_login)
         ui.button('Đăng nhập', on_click=attempt_login).classes('self-center w-full')
         ui.label("Chưa có tài khoản?").classes('text-center self-center q-mt-md')
@@ -868,15 +1237,19 @@ def login_page() -> None:
 
 @ui.page('/')
 def main_page() -> None:
-    if not cast(dict[str, Any], app.storage.user).get('authenticated'):
+    user_storage: dict[str, Any] = app.storage.user
+    if not user_storage.get('authenticated'):
         ui.navigate.to('/login')
         return
 
-    def logout() -> None:
+    async def logout() -> None:
+        await flush_pending_form_data()
         app.storage.user.clear()
         ui.navigate.to('/login')
 
     ui.query('body').style('background-color: #f0f2f5;')
+    # Aggregated validation toasts put one message per line.
+    ui.add_head_html('<style>.multi-line-notification { white-space: pre-line; }</style>')
     with ui.header(elevated=True).classes('bg-primary text-white q-pa-sm items-center'):
         ui.label("📝 AutoLý – Kê khai Sơ yếu lý lịch").classes('text-h5')
         ui.space()
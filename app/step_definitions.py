@@ -1,89 +1,109 @@
 # app/step_definitions.py
 from __future__ import annotations
 
-from .utils import AppSchema, StepDefinition
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from .utils import AppSchema, DataframeConfig, FieldConfig, StepDefinition, StepValidationPlan
 from .validation import (
-    required, required_choice, match_pattern, is_within_date_range, is_date_after,
-    max_length, FULL_NAME_PATTERN, PHONE_PATTERN, DATE_MMYYYY_PATTERN
+    required, required_choice, match_pattern, match_charset, is_within_date_range, is_date_after,
+    max_length, ValidatorFunc, FULL_NAME_CHARS, PHONE_PATTERN, DATE_MMYYYY_PATTERN
 )
 
-STEPS_BY_ID: dict[int, StepDefinition] = {
-    0: {
-        'id': 0, 'name': 'dossier_selector', 'title': 'Chọn Loại Hồ Sơ',
-        'subtitle': 'Chọn loại hồ sơ bạn cần, hệ thống sẽ tạo các bước cần thiết.',
-        'fields': [{'field': AppSchema.FORM_TEMPLATE_SELECTOR, 'validators': [required_choice("Vui lòng chọn một loại hồ sơ.")]}],
-        'dataframes': [], 'needs_clearance': None
-    },
-    1: {
-        'id': 1, 'name': 'core_identity', 'title': 'Thông tin cá nhân',
-        'subtitle': 'Thông tin định danh cơ bản của bạn.', 'needs_clearance': None,
-        'fields': [
-            {'field': AppSchema.FULL_NAME, 'validators': [
+# Shared by every MM/YYYY column in the dataframes below.
+_MMYYYY_FORMAT: ValidatorFunc = match_pattern(DATE_MMYYYY_PATTERN, 'Dùng định dạng MM/YYYY')
+
+_STEPS: tuple[StepDefinition, ...] = (
+    StepDefinition(
+        id=0, name='dossier_selector', title='Chọn Loại Hồ Sơ',
+        subtitle='Chọn loại hồ sơ bạn cần, hệ thống sẽ tạo các bước cần thiết.',
+        fields=(FieldConfig(AppSchema.FORM_TEMPLATE_SELECTOR, (required_choice("Vui lòng chọn một loại hồ sơ."),)),),
+    ),
+    StepDefinition(
+        id=1, name='core_identity', title='Thông tin cá nhân',
+        subtitle='Thông tin định danh cơ bản của bạn.',
+        fields=(
+            FieldConfig(AppSchema.FULL_NAME, (
                 required("Vui lòng điền họ tên."),
-                match_pattern(FULL_NAME_PATTERN, "Họ tên phải viết hoa."),
+                match_charset(FULL_NAME_CHARS, "Họ tên phải viết hoa."),
                 max_length(30, "Họ tên không được vượt quá 30 ký tự.")
-            ]},
-            {'field': AppSchema.GENDER, 'validators': [required_choice("Vui lòng chọn giới tính.")]},
-            {'field': AppSchema.DOB, 'validators': [required('Vui lòng điền ngày sinh.'), is_within_date_range()]},
-            {'field': AppSchema.BIRTH_PLACE, 'validators': [required("Vui lòng chọn nơi sinh.")]}
-        ],
-        'dataframes': []
-    },
-    3: {
-        'id': 3, 'name': 'contact', 'title': 'Địa chỉ & liên lạc',
-        'subtitle': 'Địa chỉ và số điện thoại để liên lạc khi cần.', 'needs_clearance': None,
-        'fields': [
-            {'field': AppSchema.REGISTERED_ADDRESS, 'validators': [
+            )),
+            FieldConfig(AppSchema.GENDER, (required_choice("Vui lòng chọn giới tính."),)),
+            FieldConfig(AppSchema.DOB, (required('Vui lòng điền ngày sinh.'), is_within_date_range())),
+            FieldConfig(AppSchema.BIRTH_PLACE, (required("Vui lòng chọn nơi sinh."),))
+        ),
+    ),
+    StepDefinition(
+        id=3, name='contact', title='Địa chỉ & liên lạc',
+        subtitle='Địa chỉ và số điện thoại để liên lạc khi cần.',
+        fields=(
+            FieldConfig(AppSchema.REGISTERED_ADDRESS, (
                 required("Vui lòng điền địa chỉ hộ khẩu."),
                 max_length(55, "Địa chỉ không được vượt quá 55 ký tự.")
-            ]},
-            {'field': AppSchema.PHONE, 'validators': [
+            )),
+            FieldConfig(AppSchema.PHONE, (
                 required('Vui lòng điền số điện thoại.'),
                 match_pattern(PHONE_PATTERN, "Số điện thoại không hợp lệ."),
                 max_length(10, "Số điện thoại phải có 10 chữ số.")
-            ]}
-        ],
-        'dataframes': []
-    },
-    5: {
-        'id': 5, 'name': 'education', 'title': 'Học vấn & Chuyên môn',
-        'subtitle': 'Quá trình học tập và đào tạo.', 'needs_clearance': None,
-        'fields': [{'field': AppSchema.EDUCATION_HIGH_SCHOOL, 'validators': [required_choice("Vui lòng chọn lộ trình học cấp ba.")]}],
-        'dataframes': [{
-            'field': AppSchema.TRAINING_DATAFRAME,
-            'validators': {
-                'training_from': [required('Điền thời gian bắt đầu.'), match_pattern(DATE_MMYYYY_PATTERN, 'Dùng định dạng MM/YYYY')],
-                'training_to': [required('Điền thời gian kết thúc.'), match_pattern(DATE_MMYYYY_PATTERN, 'Dùng định dạng MM/YYYY'), is_date_after('training_from', 'Ngày kết thúc phải sau ngày bắt đầu.')],
-                'training_unit': [required('Điền tên trường.'), max_length(26, "Tên trường không được vượt quá 26 ký tự.")],
-                'training_field': [required('Điền ngành học.'), max_length(21, "Ngành học không được vượt quá 21 ký tự.")],
-            }
-        }]
-    },
-    6: {
-        'id': 6, 'name': 'work_history', 'title': 'Quá trình Công tác',
-        'subtitle': 'Liệt kê quá trình làm việc, bắt đầu từ gần nhất.', 'needs_clearance': None,
-        'fields': [],
-        'dataframes': [{
-            'field': AppSchema.WORK_DATAFRAME,
-            'validators': {
-                'work_from': [required('Điền thời gian bắt đầu.'), match_pattern(DATE_MMYYYY_PATTERN, 'Dùng định dạng MM/YYYY')],
-                'work_to': [required('Điền thời gian kết thúc.'), match_pattern(DATE_MMYYYY_PATTERN, 'Dùng định dạng MM/YYYY'), is_date_after('work_from', 'Ngày kết thúc phải sau ngày bắt đầu.')],
-                'work_unit': [required('Điền đơn vị.'), max_length(50, "Tên đơn vị không được vượt quá 50 ký tự.")],
-            }
-        }]
-    },
-    7: {
-        'id': 7, 'name': 'awards', 'title': 'Khen thưởng & Kỷ luật',
-        'subtitle': 'Thông tin về khen thưởng và kỷ luật (nếu có).', 'needs_clearance': None,
-        'fields': [
-            {'field': AppSchema.AWARD, 'validators': [required_choice("Vui lòng chọn khen thưởng.")]},
-            {'field': AppSchema.DISCIPLINE, 'validators': [max_length(150, "Nội dung không được vượt quá 150 ký tự.")]}
-        ],
-        'dataframes': []
-    },
-    16: {
-        'id': 16, 'name': 'review', 'title': 'Xem lại & Hoàn tất',
-        'subtitle': 'Kiểm tra lại toàn bộ thông tin và tạo file PDF.', 'needs_clearance': None,
-        'fields': [], 'dataframes': []
-    },
-}
\ No newline at end of file
+            ))
+        ),
+    ),
+    StepDefinition(
+        id=5, name='education', title='Học vấn & Chuyên môn',
+        subtitle='Quá trình học tập và đào tạo.',
+        fields=(FieldConfig(AppSchema.EDUCATION_HIGH_SCHOOL, (required_choice("Vui lòng chọn lộ trình học cấp ba."),)),),
+        dataframes=(DataframeConfig(
+            AppSchema.TRAINING_DATAFRAME,
+            MappingProxyType({
+                'training_from': (required('Điền thời gian bắt đầu.'), _MMYYYY_FORMAT),
+                'training_to': (required('Điền thời gian kết thúc.'), _MMYYYY_FORMAT, is_date_after('training_from', 'Ngày kết thúc phải sau ngày bắt đầu.')),
+                'training_unit': (required('Điền tên trường.'), max_length(26, "Tên trường không được vượt quá 26 ký tự.")),
+                'training_field': (required('Điền ngành học.'), max_length(21, "Ngành học không được vượt quá 21 ký tự.")),
+            })
+        ),),
+    ),
+    StepDefinition(
+        id=6, name='work_history', title='Quá trình Công tác',
+        subtitle='Liệt kê quá trình làm việc, bắt đầu từ gần nhất.',
+        dataframes=(DataframeConfig(
+            AppSchema.WORK_DATAFRAME,
+            MappingProxyType({
+                'work_from': (required('Điền thời gian bắt đầu.'), _MMYYYY_FORMAT),
+                'work_to': (required('Điền thời gian kết thúc.'), _MMYYYY_FORMAT, is_date_after('work_from', 'Ngày kết thúc phải sau ngày bắt đầu.')),
+                'work_unit': (required('Điền đơn vị.'), max_length(50, "Tên đơn vị không được vượt quá 50 ký tự.")),
+            })
+        ),),
+    ),
+    StepDefinition(
+        id=7, name='awards', title='Khen thưởng & Kỷ luật',
+        subtitle='Thông tin về khen thưởng và kỷ luật (nếu có).',
+        fields=(
+            FieldConfig(AppSchema.AWARD, (required_choice("Vui lòng chọn khen thưởng."),)),
+            FieldConfig(AppSchema.DISCIPLINE, (max_length(150, "Nội dung không được vượt quá 150 ký tự."),))
+        ),
+    ),
+    StepDefinition(
+        id=16, name='review', title='Xem lại & Hoàn tất',
+        subtitle='Kiểm tra lại toàn bộ thông tin và tạo file PDF.',
+    ),
+)
+
+# Read-only view: the blueprint is shared by every session.
+STEPS_BY_ID: Mapping[int, StepDefinition] = MappingProxyType({step.id: step for step in _STEPS})
+
+# Per-step validation plans, built once at import instead of on every
+# confirm click. Entries and columns without validators are left out, so
+# the validation loops never visit them.
+VALIDATION_PLAN_BY_STEP_ID: Mapping[int, StepValidationPlan] = MappingProxyType({
+    step.id: StepValidationPlan(
+        simple=tuple(
+            (field_conf.field.key, field_conf.validators)
+            for field_conf in step.fields if field_conf.validators
+        ),
+        dataframes=tuple(
+            (df_conf.field.key, tuple((col_key, chain) for col_key, chain in df_conf.validators.items() if chain))
+            for df_conf in step.dataframes if any(df_conf.validators.values())
+        ),
+    )
+    for step in _STEPS
+})
\ No newline at end of file
@@ -4,8 +4,10 @@ from typing import (
     Any, NotRequired, TypedDict,
     TypeAlias,
 )
-from collections.abc import Callable
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass
+from functools import cache
+from types import MappingProxyType
 
 from .para import (
     vn_province, degrees, education_format,
@@ -48,16 +50,31 @@ class DataframePDFColumn(TypedDict):
     # The magic
     transformer: NotRequired[Callable[[dict[str, Any]], str]]
 
-SimpleValidatorEntry: TypeAlias = tuple[str, list[ValidatorFunc]]
-DataframeColumnRules: TypeAlias = dict[str, list[ValidatorFunc]]
-DataframeValidatorEntry: TypeAlias = tuple[str, DataframeColumnRules]
-ValidationEntry: TypeAlias = SimpleValidatorEntry | DataframeValidatorEntry
-
-class FieldConfig(TypedDict):
+# Validator chains are tuples built once in the blueprint: immutable and
+# cheaper to iterate than lists.
+ValidatorChain: TypeAlias = tuple[ValidatorFunc, ...]
+SimpleValidatorEntry: TypeAlias = tuple[str, ValidatorChain]
+DataframeColumnRules: TypeAlias = Mapping[str, ValidatorChain]
+# The plan keeps a dataframe's rules as (column, chain) pairs, since the
+# row loop only ever iterates them.
+DataframeColumnRuleItems: TypeAlias = tuple[tuple[str, ValidatorChain], ...]
+DataframeValidatorEntry: TypeAlias = tuple[str, DataframeColumnRuleItems]
+
+@dataclass(frozen=True, slots=True)
+class StepValidationPlan:
+    """A step's validators, split by kind once at import so running them needs no dispatch."""
+    simple: tuple[SimpleValidatorEntry, ...] = ()
+    dataframes: tuple[DataframeValidatorEntry, ...] = ()
+
+@dataclass(frozen=True, slots=True)
+class FieldConfig:
+    """A simple field on a step and the validators it runs on confirm."""
     field: FormField
-    validators: list[ValidatorFunc]
+    validators: ValidatorChain = ()
 
-class DataframeConfig(TypedDict):
+@dataclass(frozen=True, slots=True)
+class DataframeConfig:
+    """A dataframe block on a step and its per-column validators."""
     field: FormField
     validators: DataframeColumnRules
 
@@ -69,15 +86,17 @@ class TabbedLayout(TypedDict):
     type: str
     tabs: dict[str, PanelInfo]
 
-class StepDefinition(TypedDict):
+@dataclass(frozen=True, slots=True)
+class StepDefinition:
+    """One wizard step. Immutable and read by attribute on every render."""
     id: int
     name: str
     title: str
     subtitle: str
-    fields: list[FieldConfig]
-    dataframes: list[DataframeConfig]
-    needs_clearance: bool | None
-    layout: NotRequired[TabbedLayout]
+    fields: tuple[FieldConfig, ...] = ()
+    dataframes: tuple[DataframeConfig, ...] = ()
+    needs_clearance: bool | None = None
+    layout: TabbedLayout | None = None
 
 # ===================================================================
 # 2. THE APPLICATION SCHEMA (Single Source of Truth)
@@ -160,11 +179,13 @@ class AppSchema:
     )
 
     @classmethod
-    def get_all_fields(cls) -> list[FormField]:
-        return [
+    @cache
+    def get_all_fields(cls) -> tuple[FormField, ...]:
+        # The schema is fixed at import, so the class scan runs once.
+        return tuple(
             field_instance for field_instance in cls.__dict__.values()
             if isinstance(field_instance, FormField)
-        ]
+        )
 
 # ===================================================================
 # 3. CENTRALIZED CONSTANTS & SESSION MANAGEMENT
@@ -175,4 +196,14 @@ FORM_DATA_KEY: str = 'form_data'
 SELECTED_USE_CASE_KEY: str = 'selected_use_case'
 FORM_ATTEMPTED_SUBMISSION_KEY: str = 'form_attempted_submission'
 CURRENT_STEP_ERRORS_KEY: str = 'current_step_errors'
-DATE_FORMAT_STORAGE: str = '%Y-%m-%d'
\ No newline at end of file
+# Present only after a failed confirm: keys of simple fields edited since then.
+DIRTY_FIELDS_KEY: str = 'dirty_fields'
+# Bumped on every edit, so derived output (the preview PDF) can tell cheaply
+# whether form_data changed since it was built.
+FORM_DATA_VERSION_KEY: str = 'form_data_version'
+DATE_FORMAT_STORAGE: str = '%Y-%m-%d'
+
+# Field key -> default value for every schema field, for seeding new form data.
+DEFAULT_FIELD_VALUES: Mapping[str, Any] = MappingProxyType(
+    {field.key: field.default_value for field in AppSchema.get_all_fields()}
+)
@@ -1,9 +1,11 @@
 # app/validation.py
 from __future__ import annotations
 import re
+from string import ascii_uppercase
 from re import Pattern
 from typing import Any
 from collections.abc import Callable
+from functools import cache
 from datetime import date, datetime
 
 # --- Type Aliases ---
@@ -12,20 +14,37 @@ ValidationResult = tuple[bool, str]
 ValidatorFunc = Callable[[Any | None, dict[str, Any]], ValidationResult]
 
 # --- Regex Patterns (centralized) ---
-FULL_NAME_PATTERN: Pattern[str] = re.compile(r'^[A-ZÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴĐÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸ ]+$')
-PHONE_PATTERN: Pattern[str] = re.compile(r'^0\d{9}$')
-EMAIL_PATTERN: Pattern[str] = re.compile(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$")
-ID_NUMBER_PATTERN: Pattern[str] = re.compile(r'^(?:\d{9}|\d{12})$')
-YEAR_PATTERN: Pattern[str] = re.compile(r'^\d{4}$')
-NUMERIC_PATTERN: Pattern[str] = re.compile(r'^\d+$')
+# Unanchored: validators use fullmatch(), which anchors both ends itself.
+_VN_UPPERCASE_ACCENTED: str = 'ÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴĐÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸ'
+FULL_NAME_PATTERN: Pattern[str] = re.compile(f'[A-Z{_VN_UPPERCASE_ACCENTED} ]+')
+# The same alphabet as a set, for match_charset's regex-free check.
+FULL_NAME_CHARS: frozenset[str] = frozenset(ascii_uppercase + _VN_UPPERCASE_ACCENTED + ' ')
+PHONE_PATTERN: Pattern[str] = re.compile(r'0\d{9}')
+EMAIL_PATTERN: Pattern[str] = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+ID_NUMBER_PATTERN: Pattern[str] = re.compile(r'\d{9}|\d{12}')
+YEAR_PATTERN: Pattern[str] = re.compile(r'\d{4}')
+NUMERIC_PATTERN: Pattern[str] = re.compile(r'\d+')
 DATE_FORMAT_STORAGE: str = '%Y-%m-%d'
-SALARY_PATTERN: Pattern[str] = re.compile(r"^\d+$|^\d{1,3}(?:[.,]\d{3})*$")
-DATE_MMYYYY_PATTERN: Pattern[str] = re.compile(r'^(0[1-9]|1[0-2])/\d{4}$')
+SALARY_PATTERN: Pattern[str] = re.compile(r"\d+|\d{1,3}(?:[.,]\d{3})*")
+DATE_MMYYYY_PATTERN: Pattern[str] = re.compile(r'(0[1-9]|1[0-2])/\d{4}')
+
+def is_email(value: str) -> bool:
+    """
+    Checks an email address. Cheap string checks reject most malformed input
+    before falling back to EMAIL_PATTERN for full strictness.
+    """
+    local, sep, domain = value.partition('@')
+    if not (sep and local and domain) or '.' not in domain or ' ' in value:
+        return False
+    return EMAIL_PATTERN.fullmatch(value) is not None
 
 # ===================================================================
 # GENERIC VALIDATOR GENERATORS (Our Reusable Building Blocks)
 # ===================================================================
+# The factories are memoized on their (hashable) arguments: the same rule
+# and message always yields the same validator object across steps.
 
+@cache
 def max_length(limit: int, message: str) -> ValidatorFunc:
     """
     Ensures a string value does not exceed a maximum length.
@@ -39,6 +58,7 @@ def max_length(limit: int, message: str) -> ValidatorFunc:
         return True, ""
     return validator
 
+@cache
 def required(message: str = "Vui lòng không để trống trường này.") -> ValidatorFunc:
     """Ensures a value is not None, not an empty string, and not just whitespace."""
     def validator(value: Any | None, form_data: dict[str, Any]) -> ValidationResult:
@@ -51,6 +71,7 @@ def required(message: str = "Vui lòng không để trống trường này.") ->
         return True, ""
     return validator
 
+@cache
 def required_choice(message: str = "Vui lòng thực hiện lựa chọn.") -> ValidatorFunc:
     """Ensures a value from a select/radio is not None or empty/whitespace."""
     def validator(value: Any | None, form_data: dict[str, Any]) -> ValidationResult:
@@ -59,14 +80,32 @@ def required_choice(message: str = "Vui lòng thực hiện lựa chọn.") -> V
         return True, ""
     return validator
 
+@cache
 def match_pattern(pattern: Pattern[str], message: str) -> ValidatorFunc:
-    """Ensures a string value matches a regex pattern."""
+    """Ensures a whole (stripped) string value matches a regex pattern."""
+    matcher = pattern.fullmatch # Bound once per validator, not per call.
     def validator(value: Any | None, form_data: dict[str, Any]) -> ValidationResult:
         # This validator should only run if the field is not empty.
         # Chain it with required() to validate non-empty fields.
         if not value or not isinstance(value, str):
             return True, "" # Don't fail on empty values, that's `required`'s job.
-        if not pattern.match(value.strip()):
+        if not matcher(value.strip()):
+            return False, message
+        return True, ""
+    return validator
+
+@cache
+def match_charset(allowed: frozenset[str], message: str) -> ValidatorFunc:
+    """
+    Ensures a (stripped) string value only uses characters from `allowed`.
+    Equivalent to fullmatch on a `[...]+` class, but a set check runs in C.
+    """
+    is_allowed = allowed.issuperset
+    def validator(value: Any | None, form_data: dict[str, Any]) -> ValidationResult:
+        if not value or not isinstance(value, str):
+            return True, "" # Don't fail on empty values, that's `required`'s job.
+        stripped = value.strip()
+        if not stripped or not is_allowed(stripped):
             return False, message
         return True, ""
     return validator
@@ -94,6 +133,7 @@ def is_within_date_range(
         return True, ''
     return validator
 
+@cache
 def is_date_after(other_field_key: str, message: str) -> ValidatorFunc:
     """
     Validates that a MM/YYYY date in one field comes after a MM/YYYY date
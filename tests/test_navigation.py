@@ -8,10 +8,10 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from app.myapp import calculate_next_step_id, calculate_prev_step_id
-from app.form_data_builder import FormTemplate
+from app.form_data_builder import FormTemplate, FormTemplateSpec, build_step_navigation, with_step_navigation
 
 # Create a mock FormTemplate for testing purposes
-MOCK_TEMPLATE: FormTemplate = {
+MOCK_SPEC: FormTemplateSpec = {
     'name': "Test Template",
     'description': "A test template",
     'gov_form_code': None,
@@ -19,6 +19,7 @@ MOCK_TEMPLATE: FormTemplate = {
     'pdf_template_path': '',
     'dataframe_page_map': {}
 }
+MOCK_TEMPLATE: FormTemplate = with_step_navigation(MOCK_SPEC)
 
 def test_calculate_next_step() -> None:
     """Tests the logic for calculating the next step ID."""
@@ -46,4 +47,20 @@ def test_calculate_prev_step() -> None:
     assert calculate_prev_step_id(0, MOCK_TEMPLATE) == 0, "Should stay on step 0"
 
     # From an unknown step
-    assert calculate_prev_step_id(99, MOCK_TEMPLATE) == 0, "Should go to start from an unknown step"
\ No newline at end of file
+    assert calculate_prev_step_id(99, MOCK_TEMPLATE) == 0, "Should go to start from an unknown step"
+
+def test_build_step_navigation() -> None:
+    """Tests the precomputed navigation maps attached to templates."""
+    next_map, prev_map = build_step_navigation([1, 3, 5, 16])
+
+    assert next_map == {0: 1, 1: 3, 3: 5, 5: 16, 16: 16}, "Last step should map to itself"
+    assert prev_map == {1: 0, 3: 1, 5: 3, 16: 5}, "First step should map back to 0"
+
+    # An empty sequence has nowhere to go; callers fall back to step 0.
+    assert build_step_navigation([]) == ({}, {})
+
+def test_with_step_navigation_leaves_spec_untouched() -> None:
+    """Building a template copies the spec instead of adding keys to it."""
+    assert 'next_step_map' not in MOCK_SPEC and 'prev_step_map' not in MOCK_SPEC
+    assert MOCK_TEMPLATE['next_step_map'] == {0: 1, 1: 3, 3: 5, 5: 16, 16: 16}
+    assert MOCK_TEMPLATE['step_sequence'] == MOCK_SPEC['step_sequence']
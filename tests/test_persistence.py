@@ -0,0 +1,195 @@
+# tests/test_persistence.py
+from __future__ import annotations
+
+import sys
+import json
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any
+from collections.abc import Callable, Coroutine, Iterator
+
+import pytest
+
+# Make the `app` directory importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import myapp
+
+USERNAME = "user@example.com"
+
+@pytest.fixture
+def live_form_data(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[dict[str, Any]]:
+    """A fresh database holding one user, whose session form_data is returned."""
+    monkeypatch.setattr(myapp, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(myapp, 'DB_PATH', tmp_path / "autoly.db")
+    monkeypatch.setattr(myapp, '_thread_local', threading.local())
+    monkeypatch.setattr(myapp, '_PENDING_FORM_DATA', {})
+    monkeypatch.setattr(myapp, '_IN_FLIGHT_FORM_DATA', {})
+    monkeypatch.setattr(myapp, '_flush_lock', asyncio.Lock()) # Each test runs its own event loop.
+    monkeypatch.setattr(myapp, '_flush_task', None)
+    monkeypatch.setattr(myapp, '_flush_failures', 0)
+    monkeypatch.setattr(myapp, 'FORM_DATA_FLUSH_DELAY_SECONDS', 60.0) # Only explicit flushes, unless a test shortens it.
+
+    myapp.setup_database()
+    with myapp.get_db_connection() as conn:
+        conn.execute(myapp.INSERT_USER_SQL, (USERNAME, "hash", myapp._DEFAULT_FORM_DATA_JSON))
+
+    form_data: dict[str, Any] = json.loads(myapp._DEFAULT_FORM_DATA_JSON)
+    monkeypatch.setattr(myapp, 'get_current_user', lambda: USERNAME)
+    monkeypatch.setattr(myapp, 'get_form_data', lambda: form_data)
+    # Run the "worker thread" inline; the tests swap in other behaviours as needed.
+    monkeypatch.setattr(myapp.run, 'io_bound', _inline_io_bound)
+    yield form_data
+    myapp._thread_local.conn.close()
+
+async def _inline_io_bound(callback: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return callback(*args, **kwargs)
+
+async def _skipped_io_bound(callback: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return None # What nicegui's run.io_bound returns while the app is stopping.
+
+def _gated_io_bound(gate: asyncio.Event) -> Callable[..., Coroutine[Any, Any, Any]]:
+    """An io_bound whose write stays in flight until the gate is set."""
+    async def io_bound(callback: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        await gate.wait()
+        return callback(*args, **kwargs)
+    return io_bound
+
+def _stored_form_data() -> dict[str, Any]:
+    with myapp.get_db_connection() as conn:
+        (form_data_json,) = conn.execute("SELECT form_data FROM users WHERE username = ?", (USERNAME,)).fetchone()
+    return json.loads(form_data_json)
+
+def _run(test_body: Callable[[], Coroutine[Any, Any, None]]) -> None:
+    """Runs an async test body, cancelling any delayed flush it left behind."""
+    async def main() -> None:
+        try:
+            await test_body()
+        finally:
+            if myapp._flush_task is not None:
+                myapp._flush_task.cancel()
+    asyncio.run(main())
+
+def test_saves_are_debounced_into_one_write(live_form_data: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """A burst of saves lands as a single write of the latest data after the delay."""
+    monkeypatch.setattr(myapp, 'FORM_DATA_FLUSH_DELAY_SECONDS', 0.01)
+    writes: list[list[tuple[str, str]]] = []
+    write_rows = myapp._write_form_data_rows
+    def counting_write(rows: list[tuple[str, str]]) -> bool:
+        writes.append(rows)
+        return write_rows(rows)
+    monkeypatch.setattr(myapp, '_write_form_data_rows', counting_write)
+
+    async def body() -> None:
+        live_form_data[myapp.STEP_KEY] = 1
+        myapp.save_form_data_to_db()
+        live_form_data[myapp.STEP_KEY] = 3
+        myapp.save_form_data_to_db()
+        assert _stored_form_data()[myapp.STEP_KEY] == 0, "Nothing should be written before the delay"
+
+        await asyncio.sleep(0.1)
+        assert len(writes) == 1, "Both saves should share one write"
+        assert _stored_form_data()[myapp.STEP_KEY] == 3, "The latest data should be written"
+        assert not myapp._PENDING_FORM_DATA
+    _run(body)
+
+def test_logout_flush_writes_immediately(live_form_data: dict[str, Any]) -> None:
+    """The flush awaited by logout writes queued data without waiting for the delay."""
+    async def body() -> None:
+        live_form_data[myapp.STEP_KEY] = 5
+        myapp.save_form_data_to_db()
+        await myapp.flush_pending_form_data()
+        assert _stored_form_data()[myapp.STEP_KEY] == 5
+        assert not myapp._PENDING_FORM_DATA
+    _run(body)
+
+def test_login_while_pending_loads_queued_changes(live_form_data: dict[str, Any]) -> None:
+    """Logging in while another session has unsaved changes loads those changes."""
+    async def body() -> None:
+        live_form_data[myapp.STEP_KEY] = 6
+        myapp.save_form_data_to_db()
+        row = await myapp.load_login_row(USERNAME)
+        assert row is not None
+        assert json.loads(row[1] or '')[myapp.STEP_KEY] == 6
+        assert _stored_form_data()[myapp.STEP_KEY] == 6, "Login should have flushed the queue"
+    _run(body)
+
+def test_login_during_in_flight_flush_waits_for_the_write(live_form_data: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """A login that arrives while a flush is writing the user's data reads it only after the write lands."""
+    async def body() -> None:
+        gate = asyncio.Event()
+        monkeypatch.setattr(myapp.run, 'io_bound', _gated_io_bound(gate))
+        live_form_data[myapp.STEP_KEY] = 4
+        myapp.save_form_data_to_db()
+        flush = asyncio.create_task(myapp.flush_pending_form_data())
+        await asyncio.sleep(0)
+        assert not myapp._PENDING_FORM_DATA and USERNAME in myapp._IN_FLIGHT_FORM_DATA
+
+        login = asyncio.create_task(myapp.load_login_row(USERNAME))
+        await asyncio.sleep(0.01)
+        assert not login.done(), "Login must not read the row while its write is in flight"
+
+        gate.set()
+        await flush
+        row = await login
+        assert row is not None
+        assert json.loads(row[1] or '')[myapp.STEP_KEY] == 4
+    _run(body)
+
+def test_skipped_write_stays_queued_until_shutdown(live_form_data: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """When io_bound skips the write (app stopping), nothing is lost: the shutdown hook writes it."""
+    monkeypatch.setattr(myapp.run, 'io_bound', _skipped_io_bound)
+
+    async def body() -> None:
+        live_form_data[myapp.STEP_KEY] = 7
+        myapp.save_form_data_to_db()
+        await myapp.flush_pending_form_data()
+        assert _stored_form_data()[myapp.STEP_KEY] == 0, "The skipped write must not reach the database"
+        assert USERNAME in myapp._PENDING_FORM_DATA, "The skipped write should be re-queued"
+
+        # A login in the meantime still sees the queued changes.
+        row = await myapp.load_login_row(USERNAME)
+        assert row is not None and json.loads(row[1] or '')[myapp.STEP_KEY] == 7
+    _run(body)
+
+    myapp._flush_pending_form_data_on_shutdown()
+    assert _stored_form_data()[myapp.STEP_KEY] == 7
+    assert not myapp._PENDING_FORM_DATA
+
+def test_shutdown_writes_a_flush_still_in_flight(live_form_data: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """Data taken off the queue by a flush that never finishes is still written on shutdown."""
+    async def body() -> None:
+        monkeypatch.setattr(myapp.run, 'io_bound', _gated_io_bound(asyncio.Event()))
+        live_form_data[myapp.STEP_KEY] = 8
+        myapp.save_form_data_to_db()
+        flush = asyncio.create_task(myapp.flush_pending_form_data())
+        await asyncio.sleep(0)
+        assert not myapp._PENDING_FORM_DATA, "The flush should have taken the queue"
+
+        myapp._flush_pending_form_data_on_shutdown()
+        assert _stored_form_data()[myapp.STEP_KEY] == 8
+        flush.cancel()
+    _run(body)
+
+def test_failed_writes_back_off(live_form_data: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """A write that keeps failing is retried with a doubling, capped delay; a success resets it."""
+    write_rows = myapp._write_form_data_rows
+    def failing_write(rows: list[tuple[str, str]]) -> bool:
+        raise myapp.sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(myapp, '_write_form_data_rows', failing_write)
+    delays: list[float] = []
+    monkeypatch.setattr(myapp, '_schedule_flush', delays.append) # Record the retries instead of running them.
+
+    async def body() -> None:
+        myapp.save_form_data_to_db()
+        for _ in range(4):
+            await myapp.flush_pending_form_data()
+        assert delays == [60.0, 120.0, 240.0, 300.0, 300.0], "Debounce, then doubling retries capped at the maximum"
+        assert USERNAME in myapp._PENDING_FORM_DATA, "Failed writes stay queued"
+
+        monkeypatch.setattr(myapp, '_write_form_data_rows', write_rows)
+        await myapp.flush_pending_form_data()
+        assert myapp._flush_failures == 0
+        assert not myapp._PENDING_FORM_DATA
+    _run(body)
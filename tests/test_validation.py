@@ -2,10 +2,14 @@
 from __future__ import annotations
 
 import sys
+import json
 from pathlib import Path
 from datetime import date
+from types import SimpleNamespace
 from typing import Any
 
+import pytest
+
 # This is a standard way to make the `app` directory importable
 # without having to install the project in editable mode.
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -13,11 +17,25 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from app.validation import (
     required,
     match_pattern,
+    match_charset,
     is_within_date_range,
     is_date_after,
     max_length,
+    is_email,
     PHONE_PATTERN,
+    FULL_NAME_CHARS,
+    FULL_NAME_PATTERN,
+)
+from app.utils import (
+    StepValidationPlan,
+    DIRTY_FIELDS_KEY,
+    FORM_DATA_VERSION_KEY,
+    CURRENT_STEP_ERRORS_KEY,
+    FORM_ATTEMPTED_SUBMISSION_KEY,
+    SELECTED_USE_CASE_KEY,
+    STEP_KEY,
 )
+from app import myapp
 
 # Test data is just a dummy dict for context, as our validators require it.
 FORM_DATA: dict[str, Any] = {}
@@ -141,3 +159,115 @@ def test_is_date_after_validator() -> None:
     row_data_same = {'work_from': '06/2022', 'work_to': '06/2022'}
     is_invalid_same, _ = validator(row_data_same['work_to'], row_data_same)
     assert not is_invalid_same, "Should fail when 'to' date is the same as 'from' date"
+
+
+def test_is_email() -> None:
+    """Tests the email check used on signup, including its fast-path rejections."""
+    # --- Passing Cases ---
+    assert is_email("user@example.com"), "Should pass for a plain address"
+    assert is_email("first.last+tag@mail.example.vn"), "Should pass for dots, plus and subdomains"
+
+    # --- Failing Cases ---
+    assert not is_email("userexample.com"), "Should fail without '@'"
+    assert not is_email("@example.com"), "Should fail with an empty local part"
+    assert not is_email("user@"), "Should fail with an empty domain"
+    assert not is_email("user@localhost"), "Should fail without a dot in the domain"
+    assert not is_email("us er@example.com"), "Should fail with whitespace"
+    assert not is_email("user@exa@mple.com"), "Should fail with a second '@'"
+
+
+def test_match_charset_validator() -> None:
+    """Tests the set-based full-name check against the regex it replaces."""
+    validator = match_charset(FULL_NAME_CHARS, "Name must be uppercase.")
+
+    # --- Passing / Failing Cases, cross-checked with FULL_NAME_PATTERN ---
+    for name in ("NGUYỄN VĂN A", "ĐẶNG THỊ Ỷ", "  TRẦN BÌNH  ", "nguyễn văn a", "NGUYEN VAN A1", "LÊ-HOÀNG"):
+        is_valid, _ = validator(name, FORM_DATA)
+        expected = FULL_NAME_PATTERN.fullmatch(name.strip()) is not None
+        assert is_valid == expected, f"Should agree with FULL_NAME_PATTERN for {name!r}"
+
+    # --- Edge Cases ---
+    is_valid_empty, _ = validator("", FORM_DATA)
+    assert is_valid_empty, "Should pass for an empty string (not its responsibility)"
+
+    is_valid_none, _ = validator(None, FORM_DATA)
+    assert is_valid_none, "Should pass for None (not its responsibility)"
+
+
+# --- Re-validation after a failed confirm (edit tracking) ---
+NAME_REQUIRED = required("Name is required.")
+PHONE_FORMAT = match_pattern(PHONE_PATTERN, "Invalid phone number.")
+TWO_FIELD_PLAN = StepValidationPlan(simple=(('name', (NAME_REQUIRED,)), ('phone', (PHONE_FORMAT,))))
+
+def test_execute_step_validators_revalidates_only_dirty_fields() -> None:
+    """Edited fields are re-run; unedited ones keep their previous result."""
+    form_data = {'name': 'An', 'phone': '123'}
+    previous_errors = {'name': "Name is required.", 'phone': "Invalid phone number."}
+
+    # 'name' was fixed and edited; 'phone' is still wrong but was not touched.
+    is_valid, errors = myapp.execute_step_validators(
+        TWO_FIELD_PLAN, form_data, dirty={'name': True}, previous_errors=previous_errors)
+    assert not is_valid, "An unedited field should keep its previous error"
+    assert errors == {'phone': "Invalid phone number."}, "The edited field should be re-run and pass"
+
+    # An unedited field without a previous error stays valid without being re-run.
+    form_data['phone'] = 'not re-checked'
+    is_valid, errors = myapp.execute_step_validators(
+        TWO_FIELD_PLAN, form_data, dirty={'name': True}, previous_errors={})
+    assert is_valid and errors == {}, "An unedited, previously valid field should stay valid"
+
+    # Without a dirty map every field runs.
+    is_valid, errors = myapp.execute_step_validators(TWO_FIELD_PLAN, form_data)
+    assert not is_valid and set(errors) == {'phone'}, "A full pass should re-check every field"
+
+def test_validate_step_attempt_tracks_edits_until_valid() -> None:
+    """A failed attempt starts edit tracking; a successful one clears it."""
+    form_data: dict[str, Any] = {'name': '', 'phone': '0987654321'}
+
+    is_valid, _ = myapp.validate_step_attempt(TWO_FIELD_PLAN, form_data)
+    assert not is_valid
+    assert form_data[FORM_ATTEMPTED_SUBMISSION_KEY] is True
+    assert form_data[CURRENT_STEP_ERRORS_KEY] == {'name': "Name is required."}
+    assert form_data[DIRTY_FIELDS_KEY] == {}, "A failed attempt should start edit tracking"
+
+    # Editing marks the field dirty, so the next attempt re-runs it.
+    myapp._set_field_value(form_data, form_data, 'name', 'An')
+    assert form_data[DIRTY_FIELDS_KEY] == {'name': True}
+
+    is_valid, errors = myapp.validate_step_attempt(TWO_FIELD_PLAN, form_data)
+    assert is_valid and errors == {}
+    assert DIRTY_FIELDS_KEY not in form_data, "Success should clear edit tracking"
+
+    # Without tracking, edits are stored but not recorded as dirty.
+    myapp._set_field_value(form_data, form_data, 'phone', '0123456789')
+    assert DIRTY_FIELDS_KEY not in form_data
+
+def test_step_change_drops_edit_tracking(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Edit tracking belongs to one step and is dropped on navigation."""
+    monkeypatch.setattr(myapp, 'update_step_content', SimpleNamespace(refresh=lambda: None))
+    form_data: dict[str, Any] = {STEP_KEY: 1, SELECTED_USE_CASE_KEY: 'PRIVATE_SECTOR', FORM_ATTEMPTED_SUBMISSION_KEY: True,
+                                 CURRENT_STEP_ERRORS_KEY: {'name': "Name is required."}, DIRTY_FIELDS_KEY: {}}
+    myapp.next_step(form_data)
+    assert form_data[STEP_KEY] == 3
+    assert DIRTY_FIELDS_KEY not in form_data
+
+    form_data[DIRTY_FIELDS_KEY] = {}
+    myapp.prev_step(form_data)
+    assert form_data[STEP_KEY] == 1
+    assert DIRTY_FIELDS_KEY not in form_data
+
+def test_edit_tracking_is_never_persisted() -> None:
+    """The dirty map and the change counter stay out of the JSON written to the database."""
+    form_data: dict[str, Any] = {STEP_KEY: 1, DIRTY_FIELDS_KEY: {'name': True}, FORM_DATA_VERSION_KEY: 3}
+    stored = json.loads(myapp.dump_form_data(form_data))
+    assert DIRTY_FIELDS_KEY not in stored and FORM_DATA_VERSION_KEY not in stored
+    assert DIRTY_FIELDS_KEY in form_data, "The live session data should be left untouched"
+
+def test_edits_bump_the_change_counter() -> None:
+    """Every edit, including one to a dataframe row, bumps the form's change counter."""
+    row: dict[str, Any] = {}
+    form_data: dict[str, Any] = {'rows': [row]}
+    myapp._set_field_value(form_data, form_data, 'name', 'An')
+    myapp._set_field_value(form_data, row, 'school', 'THPT')
+    assert form_data[FORM_DATA_VERSION_KEY] == 2
+    assert FORM_DATA_VERSION_KEY not in row